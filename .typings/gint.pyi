@@ -420,6 +420,46 @@ def dpoly(vertices: list[int], fill: int, border: int) -> Any:
     """
     ...
 
+# Batched rendering functions (simulator only, see gint_batch.py for a
+# portable fallback)
+
+def dpixels(points: BufferLike, colors: Union[int, BufferLike]) -> None:
+    """Draw many pixels in a single call.
+
+    Args:
+        points: Flat sequence of coordinates [x0, y0, x1, y1, ...]
+                (list, array, bytes...)
+        colors: A single color for all pixels, or one color per pixel
+
+    Example:
+        dpixels([10, 10, 11, 10, 12, 10], C_BLACK)
+    """
+    ...
+
+def drects(rects: BufferLike, colors: Union[int, BufferLike]) -> None:
+    """Fill many rectangles in a single call.
+
+    Args:
+        rects: Flat sequence [x1, y1, x2, y2, ...] of inclusive corners
+        colors: A single color for all rectangles, or one per rectangle
+
+    Example:
+        drects([0, 0, 9, 9, 10, 0, 19, 9], [C_RED, C_BLUE])
+    """
+    ...
+
+def dlines(lines: BufferLike, colors: Union[int, BufferLike]) -> None:
+    """Draw many line segments in a single call.
+
+    Args:
+        lines: Flat sequence [x1, y1, x2, y2, ...] of segment endpoints
+        colors: A single color for all lines, or one per line
+
+    Example:
+        dlines([0, 0, 100, 100, 0, 100, 100, 0], C_BLACK)
+    """
+    ...
+
 def dsize(text: str, font: Optional["GintFont"]) -> Tuple[int, int]:
     """Get the width and height of rendered text.
     
@@ -551,6 +591,37 @@ def dsubimage(x: int, y: int, img: image, left: int, top: int, width: int, heigh
     """
     ...
 
+class SpriteSheet:
+    """Cells of an image, cut as a grid or given as rectangles (simulator
+    only, see gint_batch.py for a portable fallback).
+
+    Args:
+        img: Source image
+        cell_width, cell_height: Size of the grid cells, numbered left to
+                                 right then top to bottom
+        rects: Alternatively, a list of (x, y, width, height) cells
+    """
+    image: image
+    rects: List[Tuple[int, int, int, int]]
+
+    def __init__(self, img: image, cell_width: int = 0, cell_height: int = 0,
+                 rects: Optional[List[Tuple[int, int, int, int]]] = None) -> None: ...
+    def __len__(self) -> int: ...
+
+def dsprites(sheet: SpriteSheet, sprites: BufferLike) -> None:
+    """Draw many cells of a sprite sheet in a single call, in order.
+
+    Args:
+        sheet: The sprite sheet
+        sprites: Flat sequence [x0, y0, cell0, x1, y1, cell1, ...] or a list
+                 of (x, y, cell) tuples
+
+    Example:
+        tiles = SpriteSheet(tileset, 16, 16)
+        dsprites(tiles, [0, 0, 3, 16, 0, 4])
+    """
+    ...
+
 # --- Constants ---
 I: int
 KEY_F1: int
@@ -1,5 +1,4 @@
 from gint import *
-import pygame
 from random import randint
 
 # Configuration
@@ -263,7 +262,7 @@ def run():
         if keydown(KEY_EXIT): break
         if keydown(KEY_EQUALS):
             import gint
-            pygame.image.save(gint.vram, "screenshot.png")
+            gint._screenshot("screenshot.png")
         
         # ERASE OLD
         for e in entities: 
@@ -1,11 +1,21 @@
 import os
 import time
+import hashlib as _hashlib
 import pygame
 from pygame.locals import *
 import sys
-import struct
+import numpy as _np
+from bisect import bisect_right as _bisect_right
+from collections import OrderedDict as _OrderedDict, deque as _deque
+from itertools import accumulate as _accumulate, repeat as _repeat
 from typing import List, Optional, Tuple
 
+if __name__ == "__main__":
+    # Programs import gint: run the launcher in that module rather than in
+    # this copy of the file, or there would be two simulators
+    import gint
+    sys.exit(gint._main(sys.argv[1:]))
+
 
 # Display dimensions
 DWIDTH = 320
@@ -29,57 +39,217 @@ DTEXT_TOP = 'top'
 DTEXT_MIDDLE = 'middle'
 DTEXT_BOTTOM = 'bottom'
 
-# Image stuff
-IMAGE_MONO = 0
-IMAGE_P4_RGB565 = 1
-IMAGE_RGB565 = 2
+# Backend selection: "pygame" opens the simulator window, "headless" draws
+# into a NumPy RGB565 array and never touches the display (CI, batch runs)
+_BACKEND = os.environ.get("GINT_BACKEND", "pygame").lower()
+_HEADLESS = _BACKEND == "headless"
 
-# Pygame initialization
-pygame.init()
+# Stop the program after this many frames (0 = never), for unattended runs
+_MAX_FRAMES = int(os.environ.get("GINT_MAX_FRAMES", "0"))
+_frame_count = 0
 
-# Check for scaling
-SCALE = 1
-if "GDK_SCALE" in os.environ:
-    try:
-        SCALE = int(os.environ["GDK_SCALE"])
-    except ValueError:
-        pass
-elif "QT_SCALE_FACTOR" in os.environ:
-    try:
-        SCALE = int(float(os.environ["QT_SCALE_FACTOR"]))
-    except ValueError:
-        pass
+_DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "_data")
 
-screen = pygame.display.set_mode((DWIDTH * SCALE, DHEIGHT * SCALE))
-pygame.display.set_caption("ClassPad")
-vram = pygame.Surface((DWIDTH, DHEIGHT))
-clock = pygame.time.Clock()
+# Initial window scale: GINT_SCALE, or the desktop's. It can be fractional,
+# and follows the window when it is resized.
+SCALE = 1
+for _name in ("GINT_SCALE", "GDK_SCALE", "QT_SCALE_FACTOR"):
+    if _name in os.environ:
+        try:
+            SCALE = max(float(os.environ[_name]), 0.1)
+        except ValueError:
+            pass
+        break
+
+# VRAM holds native RGB565 values, exactly like the calculator's; it is
+# converted for the window only once per dupdate()
+vram = _np.full((DHEIGHT, DWIDTH), C_WHITE, dtype=_np.uint16)
+# 32-bit copy of the VRAM that gets blitted to the window (and screenshots)
+_frame = pygame.Surface((DWIDTH, DHEIGHT), 0, 32)
+# What the window currently shows (black when it opens), to find what really
+# changed between two frames
+_shown = _np.zeros_like(vram)
+
+# Regions touched since the last dupdate(), as (x0, y0, x1, y1) with x1 and
+# y1 excluded; beyond _DIRTY_MAX entries they collapse into their union
+_dirty = []
+_DIRTY_MAX = 32
+
+# The window is opened by the first frame or input call, so that importing
+# gint for its constants or images does not (nor initialize pygame)
+screen = None
 FPS = 100  # Adjust to control game speed
 
+# Where the frame is shown in the window (centered, keeping its proportions),
+# and the frame scaled to that size; kept between frames and only replaced
+# when the window is resized. None at scale 1, where _frame is shown as is.
+_view = None
+_scaled = None
+_int_scale = 1  # SCALE if it is an integer, else 0
+
+def _open_display():
+    """Initialize pygame's display and open the window"""
+    global screen
+    pygame.display.init()
+    pygame.event.set_allowed([
+        QUIT, KEYDOWN, KEYUP,
+        ACTIVEEVENT, VIDEORESIZE, VIDEOEXPOSE,
+        MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION
+    ])
+    screen = pygame.display.set_mode(
+        (round(DWIDTH * SCALE), round(DHEIGHT * SCALE)), RESIZABLE)
+    pygame.display.set_caption("ClassPad")
+    _fit_window()
+
+def _fit_window():
+    """Scale the frame to the size of the window"""
+    global screen, SCALE, _view, _scaled, _int_scale
+    screen = pygame.display.get_surface()
+    width, height = screen.get_size()
+    SCALE = min(width / DWIDTH, height / DHEIGHT)
+    w = max(round(DWIDTH * SCALE), 1)
+    h = max(round(DHEIGHT * SCALE), 1)
+    _view = pygame.Rect((width - w) // 2, (height - h) // 2, w, h)
+    _int_scale = w // DWIDTH if (w, h) == (w // DWIDTH * DWIDTH,
+                                           w // DWIDTH * DHEIGHT) else 0
+    if _int_scale == 1:
+        _scaled = None
+    else:
+        _scaled = pygame.Surface((w, h), 0, _frame)
+    if _hud is not None:
+        _hud.font = None  # For the new scale
+    screen.fill((0, 0, 0))
+
 # --- NEW: Window Clipping State ---
 _dwindow = (0, 0, DWIDTH, DHEIGHT)
+# Window intersected with the screen, used by the rasterizer
+_clip = (0, 0, DWIDTH, DHEIGHT)
+
+def _build_rgb565_lut(surface: pygame.Surface):
+    """Map all 65536 RGB565 values to pixels in the format of a 32-bit surface"""
+    c = _np.arange(65536, dtype=_np.uint32)
+    r5 = (c >> 11) & 0x1F
+    g6 = (c >>  5) & 0x3F
+    b5 =  c        & 0x1F
+    # expand to 8 bits:   abcde → abcde00 | abcde>>3
+    r8 = (r5 << 3) | (r5 >> 2)
+    g8 = (g6 << 2) | (g6 >> 4)
+    b8 = (b5 << 3) | (b5 >> 2)
+    rs, gs, bs, _ = surface.get_shifts()
+    alpha = surface.get_masks()[3]
+    return ((r8 << rs) | (g8 << gs) | (b8 << bs) | alpha).astype(_np.uint32)
+
+_RGB565_LUT = _build_rgb565_lut(_frame)
+
+def _upload(x0: int = 0, y0: int = 0, x1: int = DWIDTH, y1: int = DHEIGHT):
+    """Convert a region of the VRAM into the 32-bit frame through the LUT"""
+    pixels = pygame.surfarray.pixels2d(_frame)
+    _np.take(_RGB565_LUT, vram[y0:y1, x0:x1].T, out=pixels[x0:x1, y0:y1],
+            mode='clip')
+    del pixels  # Unlock the surface
+
+# Pixels written since the start, for the profiling tools
+_pixels_drawn = 0
+
+def _mark_dirty(x0: int, y0: int, x1: int, y1: int, pixels: Optional[int] = None):
+    """Record that the region from (x0, y0) to (x1, y1) excluded was drawn to
+    (only `pixels` pixels of it, when given)"""
+    global _pixels_drawn
+    _pixels_drawn += (x1 - x0) * (y1 - y0) if pixels is None else pixels
+    if len(_dirty) >= _DIRTY_MAX:
+        union = (min(r[0] for r in _dirty), min(r[1] for r in _dirty),
+                 max(r[2] for r in _dirty), max(r[3] for r in _dirty))
+        _dirty.clear()
+        _dirty.append(union)
+    _dirty.append((x0, y0, x1, y1))
+
+def _merge_rects(rects: list) -> list:
+    """Merge overlapping rectangles until no two of them intersect"""
+    merged = []
+    for rect in rects:
+        x0, y0, x1, y1 = rect
+        i = 0
+        while i < len(merged):
+            m = merged[i]
+            if x0 < m[2] and m[0] < x1 and y0 < m[3] and m[1] < y1:
+                x0, y0 = min(x0, m[0]), min(y0, m[1])
+                x1, y1 = max(x1, m[2]), max(y1, m[3])
+                del merged[i]
+                i = 0
+            else:
+                i += 1
+        merged.append((x0, y0, x1, y1))
+    return merged
+
+def _changed_rects() -> list:
+    """Shrink the dirty regions to the pixels that differ from the last frame"""
+    changed = []
+    for x0, y0, x1, y1 in _merge_rects(_dirty):
+        diff = vram[y0:y1, x0:x1] != _shown[y0:y1, x0:x1]
+        rows = _np.flatnonzero(diff.any(axis=1))
+        if not len(rows):
+            continue
+        cols = _np.flatnonzero(diff.any(axis=0))
+        changed.append((x0 + int(cols[0]), y0 + int(rows[0]),
+                        x0 + int(cols[-1]) + 1, y0 + int(rows[-1]) + 1))
+    _dirty.clear()
+    return changed
+
+def _present(rects: Optional[list] = None):
+    """Upload, scale and show regions of the VRAM (default: what changed)"""
+    if screen is None:
+        _open_display()
+    if rects is None:
+        rects = _changed_rects()
+    hud = _hud is not None and _hud.visible
+    if not rects and not hud:
+        return
 
-def _to_rgb(color: int) -> tuple:
-    """Convert RGB888 int to pygame color tuple"""
-    # return ((color >> 16) & 0xFF, (color >> 8) & 0xFF, color & 0xFF)
-    # if it fits in 16 bits, decode RGB565 → RGB888
-    if 0 <= color <= 0xFFFF:
-        r5 = (color >> 11) & 0x1F
-        g6 = (color >>  5) & 0x3F
-        b5 =  color        & 0x1F
-        # expand to 8 bits:   abcde → abcde00 | abcde>>3
-        r8 = (r5 << 3) | (r5 >> 2)
-        g8 = (g6 << 2) | (g6 >> 4)
-        b8 = (b5 << 3) | (b5 >> 2)
-        return (r8, g8, b8)
-    # otherwise assume it’s already RGB888
-    return ((color >> 16) & 0xFF,
-            (color >>  8) & 0xFF,
-             color        & 0xFF)
-
-def _from_rgb(pixel: pygame.Color) -> int:
-    """Convert pygame color to RGB888 int"""
-    return (pixel[0] << 16) | (pixel[1] << 8) | pixel[2]
+    for x0, y0, x1, y1 in rects:
+        _shown[y0:y1, x0:x1] = vram[y0:y1, x0:x1]
+        _upload(x0, y0, x1, y1)
+    if _scaled is not None and rects:
+        if _int_scale:
+            # Regions scale exactly: only redo those that changed
+            for x0, y0, x1, y1 in rects:
+                area = pygame.Rect(x0, y0, x1 - x0, y1 - y0)
+                pygame.transform.scale(
+                    _frame.subsurface(area),
+                    (area.w * _int_scale, area.h * _int_scale),
+                    _scaled.subsurface(_scaled_rect(x0, y0, x1, y1)))
+        else:
+            # Scaled separately, regions would not line up with each other
+            pygame.transform.scale(_frame, _view.size, _scaled)
+    updated = [_blit_frame(*rect) for rect in rects]
+    if hud:
+        updated += _hud.draw()
+    pygame.display.update(updated)
+
+def _scaled_rect(x0: int, y0: int, x1: int, y1: int) -> pygame.Rect:
+    """Area of the scaled frame covering a region of the VRAM"""
+    w, h = _view.size
+    left = x0 * w // DWIDTH
+    top = y0 * h // DHEIGHT
+    return pygame.Rect(left, top, -(-x1 * w // DWIDTH) - left,
+                       -(-y1 * h // DHEIGHT) - top)
+
+def _blit_frame(x0: int, y0: int, x1: int, y1: int) -> pygame.Rect:
+    """Copy a region of the uploaded frame to the window, returns its area"""
+    area = _scaled_rect(x0, y0, x1, y1)
+    screen.blit(_frame if _scaled is None else _scaled, area.move(_view.topleft),
+                area)
+    return area.move(_view.topleft)
+
+def _touch_pos(pos) -> Tuple[int, int]:
+    """VRAM coordinates of a window position, on the nearest edge if outside"""
+    x = min(max(pos[0] - _view.x, 0), _view.w - 1)
+    y = min(max(pos[1] - _view.y, 0), _view.h - 1)
+    return x * DWIDTH // _view.w, y * DHEIGHT // _view.h
+
+def _screenshot(path: str = "screenshot.png"):
+    """Save the current VRAM contents to an image file"""
+    _upload()
+    pygame.image.save(_frame, path)
 
 def C_RGB(r: int, g: int, b: int) -> int:
     """Create RGB888 from RGB555 components"""
@@ -95,48 +265,305 @@ def dwindow_get() -> Tuple[int, int, int, int]:
 
 def dwindow_set(left: int, top: int, right: int, bottom: int):
     """Set the rendering window to clip drawing operations."""
-    global _dwindow
+    global _dwindow, _clip
     _dwindow = (left, top, right, bottom)
-    
-    # Use pygame's built-in clipping for efficiency
-    clip_rect = pygame.Rect(left, top, right - left, bottom - top)
-    vram.set_clip(clip_rect)
+    _clip = (max(left, 0), max(top, 0), min(right, DWIDTH), min(bottom, DHEIGHT))
+
+# ------------------------------------------------------------------------------
+
+# Rasterizer: every primitive writes native RGB565 values into the NumPy VRAM,
+# clipped against the dwindow rectangle
+
+def _color565(color: int) -> int:
+    """Convert a gint color (or an RGB888 int) to native RGB565"""
+    if 0 <= color <= 0xFFFF:
+        return color
+    return ((color >> 8) & 0xF800) | ((color >> 5) & 0x07E0) | ((color >> 3) & 0x001F)
+
+def _np_rect(x1: int, y1: int, x2: int, y2: int, color: int):
+    """Fill the rectangle from (x1, y1) to (x2, y2) included"""
+    left, top, right, bottom = _clip
+    x1 = max(x1, left)
+    y1 = max(y1, top)
+    x2 = min(x2, right - 1)
+    y2 = min(y2, bottom - 1)
+    if x1 > x2 or y1 > y2:
+        return
+    _mark_dirty(x1, y1, x2 + 1, y2 + 1)
+    region = vram[y1:y2+1, x1:x2+1]
+    if color == C_INVERT:
+        _np.bitwise_xor(region, 0xFFFF, out=region)
+    else:
+        region[...] = _color565(color)
+
+def _np_color565(colors):
+    """Convert an array of gint colors (or RGB888 ints) to native RGB565"""
+    rgb888 = colors > 0xFFFF
+    if rgb888.any():
+        colors = _np.where(rgb888, ((colors >> 8) & 0xF800)
+                           | ((colors >> 5) & 0x07E0)
+                           | ((colors >> 3) & 0x001F), colors)
+    return colors.astype(_np.uint16)
+
+def _np_points(xs, ys, color):
+    """Plot the pixels at coordinates (xs[i], ys[i]) in color (or color[i])"""
+    left, top, right, bottom = _clip
+    inside = (xs >= left) & (xs < right) & (ys >= top) & (ys < bottom)
+    per_pixel = isinstance(color, _np.ndarray)
+    if per_pixel:
+        inside &= color != C_NONE
+        color = color[inside]
+    xs = xs[inside]
+    ys = ys[inside]
+    if not len(xs):
+        return
+    _mark_dirty(int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1,
+                len(xs))
+    pixels = vram.reshape(-1)
+    if not per_pixel:
+        if color == C_INVERT:
+            # A pixel inverted an even number of times is left unchanged
+            flat, counts = _np.unique(ys * DWIDTH + xs, return_counts=True)
+            pixels[flat[(counts & 1) == 1]] ^= 0xFFFF
+        else:
+            vram[ys, xs] = _color565(color)
+        return
+    # As if drawn one at a time: each pixel gets its last solid color, then
+    # flips once for every C_INVERT after it
+    flat, pixel = _np.unique(ys * DWIDTH + xs, return_inverse=True)
+    order = _np.arange(len(pixel))
+    invert = color == C_INVERT
+    last = _np.full(len(flat), -1)
+    _np.maximum.at(last, pixel[~invert], order[~invert])
+    solid = last >= 0
+    pixels[flat[solid]] = _np_color565(color[last[solid]])
+    flips = _np.bincount(pixel[invert & (order > last[pixel])],
+                        minlength=len(flat))
+    pixels[flat[(flips & 1) == 1]] ^= 0xFFFF
+
+def _np_mask(x: int, y: int, mask, color: int):
+    """Fill the pixels set in a boolean mask whose top-left corner is (x, y)"""
+    h, w = mask.shape
+    left, top, right, bottom = _clip
+    x0 = max(x, left)
+    y0 = max(y, top)
+    x1 = min(x + w, right)
+    y1 = min(y + h, bottom)
+    if x0 >= x1 or y0 >= y1:
+        return
+    _mark_dirty(x0, y0, x1, y1)
+    mask = mask[y0-y:y1-y, x0-x:x1-x]
+    region = vram[y0:y1, x0:x1]
+    if color == C_INVERT:
+        _np.bitwise_xor(region, 0xFFFF, out=region, where=mask)
+    else:
+        _np.copyto(region, _np.uint16(_color565(color)), where=mask)
+
+def _np_blit(x: int, y: int, pixels, alpha):
+    """Copy an RGB565 array to (x, y), skipping pixels where alpha is False"""
+    h, w = pixels.shape
+    left, top, right, bottom = _clip
+    x0 = max(x, left)
+    y0 = max(y, top)
+    x1 = min(x + w, right)
+    y1 = min(y + h, bottom)
+    if x0 >= x1 or y0 >= y1:
+        return
+    _mark_dirty(x0, y0, x1, y1)
+    src = pixels[y0-y:y1-y, x0-x:x1-x]
+    if alpha is None:
+        vram[y0:y1, x0:x1] = src
+    else:
+        _np.copyto(vram[y0:y1, x0:x1], src, where=alpha[y0-y:y1-y, x0-x:x1-x])
+
+def _np_line(x1: int, y1: int, x2: int, y2: int, color: int):
+    """Draw a line with the same pixel choices as Bresenham's algorithm"""
+    if y1 == y2 or x1 == x2:
+        _np_rect(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), color)
+        return
+    dx = x2 - x1
+    dy = y2 - y1
+    n = max(abs(dx), abs(dy))
+    t = _np.arange(n + 1)
+    xs = x1 + (2 * dx * t + n) // (2 * n)
+    ys = y1 + (2 * dy * t + n) // (2 * n)
+    _np_points(xs, ys, color)
+
+def _np_clip_box(x: int, y: int, w: int, h: int):
+    """Part of the w*h box at (x, y) inside the clip, as (x0, y0, x1, y1)"""
+    left, top, right, bottom = _clip
+    x0, y0 = max(x, left), max(y, top)
+    x1, y1 = min(x + w, right), min(y + h, bottom)
+    if x0 >= x1 or y0 >= y1:
+        return None
+    return x0, y0, x1, y1
+
+def _np_ellipse_mask(w: int, h: int, x0: int, y0: int, x1: int, y1: int):
+    """Masks of the filled interior and the 1-pixel outline of a w*h ellipse,
+    over the columns x0 to x1-1 and rows y0 to y1-1 of its box"""
+    # One more pixel around, for the neighbours of the outline
+    ys, xs = _np.ogrid[y0-1:y1+1, x0-1:x1+1]
+    # Work in doubled coordinates so that pixel centers stay integers
+    rx = max(w - 1, 1)
+    ry = max(h - 1, 1)
+    nx = (2 * xs - (w - 1)) * ry
+    ny = (2 * ys - (h - 1)) * rx
+    rr = rx * ry
+    # Same tolerance as the midpoint algorithm (r^2 + r for circles)
+    inside = nx * nx + ny * ny <= rr * rr + 2 * rr * min(rx, ry)
+    inside &= (xs >= 0) & (xs < w) & (ys >= 0) & (ys < h)
+    # A pixel is on the outline if one of its 4 neighbours is outside
+    core = (inside[:-2, 1:-1] & inside[2:, 1:-1]
+            & inside[1:-1, :-2] & inside[1:-1, 2:])
+    inside = inside[1:-1, 1:-1]
+    return inside, inside & ~core
+
+def _np_polygon_mask(xs, ys, x0: int, y0: int, w: int, h: int):
+    """Even-odd fill mask of a polygon over the w*h box at (x0, y0)"""
+    px = _np.asarray(xs, dtype=_np.float64)
+    py = _np.asarray(ys, dtype=_np.float64)
+    qx = _np.roll(px, -1)
+    qy = _np.roll(py, -1)
+    # Sample at pixel centers; rows on axis 0, edges on axis 1
+    cy = (_np.arange(h) + y0 + 0.5)[:, None]
+    crosses = (py <= cy) != (qy <= cy)
+    with _np.errstate(divide="ignore", invalid="ignore"):
+        cx = px + (cy - py) * (qx - px) / (qy - py)
+    # Pixel i of a row is right of the crossings at cx < x0 + i + 0.5: each
+    # crossing flips the parity from its first such pixel to the row end
+    rows, edges = _np.nonzero(crosses)
+    first = _np.floor(cx[rows, edges] - x0 - 0.5).astype(_np.int64) + 1
+    flips = _np.bincount(rows * (w + 1) + _np.clip(first, 0, w),
+                        minlength=h * (w + 1)).reshape(h, w + 1)
+    return (_np.cumsum(flips[:, :w], axis=1) & 1).astype(bool)
 
 # Drawing functions
 def dclear(color: int):
     if color == C_NONE:
         return
-    vram.fill(_to_rgb(color))
+    _np_rect(0, 0, DWIDTH - 1, DHEIGHT - 1, color)
 
 def dupdate():
     """Update display with VRAM changes"""
-    if SCALE == 1:
-        screen.blit(vram, (0, 0))
+    global _frame_count
+    if _launcher is not None:
+        _launcher.check()
+    _frame_count += 1
+    if _MAX_FRAMES and _frame_count >= _MAX_FRAMES:
+        raise SystemExit(0)
+    if _input_log is not None:
+        _input_log.check_end()
+    if _hud is not None:
+        _hud.end_frame()
+    start = time.perf_counter()
+    if _HEADLESS:
+        _dirty.clear()
     else:
-        scaled = pygame.transform.scale(vram, (DWIDTH * SCALE, DHEIGHT * SCALE))
-        screen.blit(scaled, (0, 0))
-
-    pygame.display.flip()
-    clock.tick(FPS)
+        # Only the regions that changed since the last frame are sent
+        _present()
+    if _latency is not None:
+        _latency.frame()
+    _pace(start)
+    if _hud is not None:
+        _hud.update_time = time.perf_counter() - start
+
+# Frame pacing, selected with GINT_PACING or _set_pacing():
+# - "fixed": at most FPS frames per second (a number sets the rate instead),
+#   the default in a window;
+# - "uncapped": as fast as possible, the default when headless;
+# - "device": each dupdate() takes as long as a full-screen transfer on the
+#   calculator (GINT_DEVICE_UPDATE_MS; the default is an estimate).
+# GINT_FRAME_REPORT=1 prints frame interval statistics at exit.
+_DEVICE_UPDATE_MS = float(os.environ.get("GINT_DEVICE_UPDATE_MS", "20"))
+_pacing = "uncapped" if _HEADLESS else "fixed"
+_pacing_fps = None
+
+# Present-to-present intervals and how they split (seconds), only recorded
+# for GINT_FRAME_REPORT
+_frame_intervals = None
+_frame_program_time = 0.0
+_frame_present_time = 0.0
+_frame_wait_time = 0.0
+_last_present = None
+
+def _set_pacing(mode: str, fps: Optional[int] = None):
+    """Select "fixed" (optionally at `fps`), "uncapped" or "device" pacing"""
+    global _pacing, _pacing_fps
+    if mode.isdigit():
+        mode, fps = "fixed", int(mode)
+    if mode not in ("fixed", "uncapped", "device"):
+        raise ValueError(f"unknown pacing mode {mode!r}")
+    _pacing = mode
+    _pacing_fps = fps
+
+def _pace(start: float):
+    """Wait as required by the pacing mode; `start` is when dupdate() began"""
+    global _last_present, _frame_program_time, _frame_present_time
+    global _frame_wait_time
+    presented = time.perf_counter()
+    if _pacing == "fixed":
+        if _last_present is not None:
+            deadline = _last_present + 1 / (_pacing_fps or FPS)
+            if presented < deadline:
+                time.sleep(deadline - presented)
+    elif _pacing == "device":
+        deadline = start + _DEVICE_UPDATE_MS / 1000
+        if presented < deadline:
+            time.sleep(deadline - presented)
+    now = time.perf_counter()
+
+    if _last_present is not None and _frame_intervals is not None:
+        _frame_intervals.append(now - _last_present)
+        _frame_program_time += start - _last_present
+        _frame_present_time += presented - start
+        _frame_wait_time += now - presented
+    _last_present = now
+
+def _frame_report() -> dict:
+    """Statistics of the intervals between presented frames, in milliseconds"""
+    count = len(_frame_intervals or ())
+    if not count:
+        return {'frames': 0}
+    ms = _np.array(_frame_intervals) * 1000
+    return {
+        'frames': count,
+        'fps': 1000 / ms.mean(),
+        'mean_ms': ms.mean(),
+        'p50_ms': _np.percentile(ms, 50),
+        'p95_ms': _np.percentile(ms, 95),
+        'p99_ms': _np.percentile(ms, 99),
+        'max_ms': ms.max(),
+        'program_ms': _frame_program_time * 1000 / count,
+        'present_ms': _frame_present_time * 1000 / count,
+        'wait_ms': _frame_wait_time * 1000 / count,
+    }
+
+def _print_frame_report():
+    report = _frame_report()
+    if not report['frames']:
+        return
+    print(f"gint: {report['frames']} frames, {report['fps']:.1f} fps ({_pacing})",
+          file=sys.stderr)
+    print("gint: interval ms: mean {mean_ms:.2f}  p50 {p50_ms:.2f}  "
+          "p95 {p95_ms:.2f}  p99 {p99_ms:.2f}  max {max_ms:.2f}".format(**report),
+          file=sys.stderr)
+    print("gint: per frame ms: program {program_ms:.2f}  present {present_ms:.2f}"
+          "  pacing {wait_ms:.2f}".format(**report), file=sys.stderr)
 
 def dpixel(x: int, y: int, color: int):
     if color == C_NONE or not (0 <= x < DWIDTH and 0 <= y < DHEIGHT):
         return
-    vram.set_at((x, y), _to_rgb(color))
+    _np_rect(x, y, x, y, color)
 
 def dgetpixel(x: int, y: int) -> int:
     if not (0 <= x < DWIDTH and 0 <= y < DHEIGHT):
         return C_NONE
-    return _from_rgb(vram.get_at((x, y)))
+    return int(vram[y, x])
 
 def drect(x1: int, y1: int, x2: int, y2: int, color: int):
     if color == C_NONE:
         return
-    x = min(x1, x2)
-    y = min(y1, y2)
-    w = abs(x2 - x1) + 1
-    h = abs(y2 - y1) + 1
-    pygame.draw.rect(vram, _to_rgb(color), pygame.Rect(x, y, w, h))
+    _np_rect(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), color)
 
 def drect_border(x1: int, y1: int, x2: int, y2: int,
                fill: int, border_width: int, border: int):
@@ -144,16 +571,21 @@ def drect_border(x1: int, y1: int, x2: int, y2: int,
         drect(x1, y1, x2, y2, fill)
     
     if border != C_NONE and border_width > 0:
+        # The border is drawn inside the rectangle bounds
         x = min(x1, x2)
         y = min(y1, y2)
-        w = abs(x2 - x1)
-        h = abs(y2 - y1)
-        pygame.draw.rect(vram, _to_rgb(border), pygame.Rect(x, y, w, h), border_width)
+        xe = max(x1, x2)
+        ye = max(y1, y2)
+        b = border_width - 1
+        _np_rect(x, y, xe, y + b, border)
+        _np_rect(x, ye - b, xe, ye, border)
+        _np_rect(x, y + b + 1, x + b, ye - b - 1, border)
+        _np_rect(xe - b, y + b + 1, xe, ye - b - 1, border)
 
 def dline(x1: int, y1: int, x2: int, y2: int, color: int):
     if color == C_NONE:
         return
-    pygame.draw.line(vram, _to_rgb(color), (x1, y1), (x2, y2))
+    _np_line(x1, y1, x2, y2, color)
 
 def dhline(y: int, color: int):
     dline(0, y, DWIDTH-1, y, color)
@@ -162,34 +594,137 @@ def dvline(x: int, color: int):
     dline(x, 0, x, DHEIGHT-1, color)
 
 def dcircle(x: int, y: int, r: int, fill: int, border: int):
+    _np_ellipse(x - r, y - r, x + r, y + r, fill, border)
+
+def _np_ellipse(x1: int, y1: int, x2: int, y2: int, fill: int, border: int):
+    box = _np_clip_box(x1, y1, x2 - x1 + 1, y2 - y1 + 1)
+    if box is None:
+        return
+    x0, y0, x3, y3 = box
+    inside, outline = _np_ellipse_mask(x2 - x1 + 1, y2 - y1 + 1,
+                                       x0 - x1, y0 - y1, x3 - x1, y3 - y1)
     if fill != C_NONE:
-        pygame.draw.circle(vram, _to_rgb(fill), (x, y), r)
+        _np_mask(x0, y0, inside & ~outline if border != C_NONE else inside, fill)
     if border != C_NONE:
-        pygame.draw.circle(vram, _to_rgb(border), (x, y), r, 1)
+        _np_mask(x0, y0, outline, border)
 
 def dellipse(x1: int, y1: int, x2: int, y2: int, fill: int, border: int):
-    rect = pygame.Rect(min(x1, x2), min(y1, y2), abs(x2-x1), abs(y2-y1))
-    if fill != C_NONE:
-        pygame.draw.ellipse(vram, _to_rgb(fill), rect)
-    if border != C_NONE:
-        pygame.draw.ellipse(vram, _to_rgb(border), rect, 1)
+    _np_ellipse(min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2), fill, border)
 
 def dpoly(vertices: List[int], fill: int, border: int):
     """Draw polygon with fill and border"""
     if len(vertices) % 2 != 0:
         raise ValueError("Vertices must contain even number of coordinates")
-    
-    points = [(vertices[i], vertices[i+1]) for i in range(0, len(vertices), 2)]
-    
+
+    xs = vertices[0::2]
+    ys = vertices[1::2]
+
     # Draw filled polygon
-    if fill != C_NONE:
-        pygame.draw.polygon(vram, _to_rgb(fill), points, 0)
-    
+    if fill != C_NONE and xs:
+        box = _np_clip_box(min(xs), min(ys), max(xs) - min(xs) + 1,
+                           max(ys) - min(ys) + 1)
+        if box is not None:
+            x0, y0, x1, y1 = box
+            _np_mask(x0, y0, _np_polygon_mask(xs, ys, x0, y0, x1 - x0, y1 - y0),
+                     fill)
+
     # Draw border
     if border != C_NONE:
-        pygame.draw.polygon(vram, _to_rgb(border), points, 1)
+        for i in range(len(xs)):
+            j = (i + 1) % len(xs)
+            _np_line(xs[i], ys[i], xs[j], ys[j], border)
 
+# ------------------------------------------------------------------------------
 
+# Batched drawing: coordinates and colors are flat sequences (lists, array,
+# bytes or NumPy arrays) rasterized in a single pass. The calculator does not
+# have these functions; gint_batch.py provides the same API for it.
+
+def _batch_ints(seq):
+    """View a flat sequence of integers as a NumPy array"""
+    if isinstance(seq, (bytes, bytearray, memoryview)):
+        seq = _np.frombuffer(seq, dtype=_np.uint8)
+    return _np.asarray(seq, dtype=_np.int64).ravel()
+
+def _batch_coords(seq, group: int):
+    """Split a flat coordinate sequence into rows of `group` values"""
+    coords = _batch_ints(seq)
+    if len(coords) % group != 0:
+        raise ValueError(f"Coordinates must come in groups of {group}")
+    return coords.reshape(-1, group)
+
+def _batch_colors(colors, count: int):
+    """Either a single color or an array of exactly `count` colors"""
+    if isinstance(colors, int):
+        return colors
+    colors = _batch_ints(colors)
+    if len(colors) != count:
+        raise ValueError(f"Expected {count} colors, got {len(colors)}")
+    return colors
+
+def dpixels(points, colors):
+    """Draw pixels given as [x0, y0, x1, y1, ...] in one or several colors"""
+    p = _batch_coords(points, 2)
+    colors = _batch_colors(colors, len(p))
+    if not len(p) or (isinstance(colors, int) and colors == C_NONE):
+        return
+    _np_points(p[:, 0], p[:, 1], colors)
+
+def drects(rects, colors):
+    """Fill rectangles given as [x1, y1, x2, y2, ...] (inclusive) at once"""
+    r = _batch_coords(rects, 4)
+    colors = _batch_colors(colors, len(r))
+    if not len(r) or (isinstance(colors, int) and colors == C_NONE):
+        return
+    if isinstance(colors, int):
+        colors = _np.full(len(r), colors, dtype=_np.int64)
+
+    # Clip all rectangles at once, with x1 and y1 now excluded
+    left, top, right, bottom = _clip
+    x1 = _np.maximum(_np.minimum(r[:, 0], r[:, 2]), left)
+    y1 = _np.maximum(_np.minimum(r[:, 1], r[:, 3]), top)
+    x2 = _np.minimum(_np.maximum(r[:, 0], r[:, 2]) + 1, right)
+    y2 = _np.minimum(_np.maximum(r[:, 1], r[:, 3]) + 1, bottom)
+    keep = (x1 < x2) & (y1 < y2) & (colors != C_NONE)
+    if not keep.any():
+        return
+    x1, y1, x2, y2, colors = x1[keep], y1[keep], x2[keep], y2[keep], colors[keep]
+    _mark_dirty(int(x1.min()), int(y1.min()), int(x2.max()), int(y2.max()),
+                int(((x2 - x1) * (y2 - y1)).sum()))
+
+    invert = (colors == C_INVERT).tolist()
+    values = _np_color565(_np.maximum(colors, 0)).tolist()
+    for a, b, c, d, v, inv in zip(x1.tolist(), y1.tolist(), x2.tolist(),
+                                  y2.tolist(), values, invert):
+        if inv:
+            region = vram[b:d, a:c]
+            _np.bitwise_xor(region, 0xFFFF, out=region)
+        else:
+            vram[b:d, a:c] = v
+
+def dlines(lines, colors):
+    """Draw line segments given as [x1, y1, x2, y2, ...] at once"""
+    l = _batch_coords(lines, 4)
+    colors = _batch_colors(colors, len(l))
+    if not len(l) or (isinstance(colors, int) and colors == C_NONE):
+        return
+
+    # Same pixels as _np_line(), with all the lines laid end to end
+    x1, y1, x2, y2 = l.T
+    dx = x2 - x1
+    dy = y2 - y1
+    n = _np.maximum(_np.abs(dx), _np.abs(dy))
+    counts = n + 1
+    line = _np.repeat(_np.arange(len(l)), counts)
+    t = _np.arange(int(counts.sum())) \
+        - _np.repeat(_np.cumsum(counts) - counts, counts)
+    n = n[line]
+    d = 2 * _np.maximum(n, 1)
+    xs = x1[line] + (2 * dx[line] * t + n) // d
+    ys = y1[line] + (2 * dy[line] * t + n) // d
+    if not isinstance(colors, int):
+        colors = colors[line]
+    _np_points(xs, ys, colors)
 
 # ------------------------------------------------------------------------------
 
@@ -200,6 +735,8 @@ class GintFont:
     def __init__(self, prop, line_height, data_height, block_count, glyph_count,
                  char_spacing, line_distance, blocks, data, width, storage_size,
                  glyph_index, glyph_width):
+        # Flags byte of fxconv: bold << 7 | italic << 6 | serif << 5 |
+        # mono << 4 | proportional
         self.prop = prop
         self.line_height = line_height
         self.data_height = data_height
@@ -213,6 +750,39 @@ class GintFont:
         self.storage_size = storage_size
         self.glyph_index = glyph_index
         self.glyph_width = glyph_width
+        # {char: glyph width + char_spacing}, built on first measurement
+        self._advances = None
+        self._fallback_advance = 0
+        # Glyph atlas, decoded on first use (see _font_atlas)
+        self._glyphs = None
+        self._widths = None
+        self._block_starts = None
+        self._block_lengths = None
+        self._block_slots = None
+        self._fallback_slot = -1
+        # Height reported by dsize() and offset of the glyphs from (x, y)
+        self._height = line_height
+        self._origin = (0, 0)
+
+    def text_prefix(self, text: str) -> List[int]:
+        """Cumulative advances: prefix[i] is the advance of text[:i]"""
+        advances = _font_advances(self)
+        return [0, *_accumulate(map(advances.get, text,
+                                   _repeat(self._fallback_advance)))]
+
+    def text_width(self, prefix: List[int], start: int = 0,
+                   end: Optional[int] = None) -> int:
+        """Width of text[start:end] in pixels, from text_prefix(text)"""
+        if end is None:
+            end = len(prefix) - 1
+        if end <= start:
+            return 0
+        return prefix[end] - prefix[start] - self.char_spacing
+
+    def text_fit(self, prefix: List[int], width: int, start: int = 0) -> int:
+        """How many characters of text[start:] fit in `width` pixels"""
+        limit = prefix[start] + width + self.char_spacing
+        return max(_bisect_right(prefix, limit) - 1 - start, 0)
 
 
 _default_font = GintFont(  # Create a default font object
@@ -223,6 +793,14 @@ _default_font = GintFont(  # Create a default font object
 )
 _current_font = _default_font
 
+def font(prop, line_height, data_height, block_count, glyph_count,
+         char_spacing, line_distance, blocks, data, width, storage_size,
+         glyph_index, glyph_width) -> GintFont:
+    """Create a font from topti data, as generated by fxconv --py"""
+    return GintFont(prop, line_height, data_height, block_count, glyph_count,
+                    char_spacing, line_distance, blocks, data, width,
+                    storage_size, glyph_index, glyph_width)
+
 def dfont(font: GintFont):
     global _current_font
     _current_font = font
@@ -230,12 +808,19 @@ def dfont(font: GintFont):
 # ------------------------------------------------------------------------------
 
 # Load bitmap font
-_uf8x9_font = pygame.image.load("_data/font8x9.png").convert()
-# _uf8x9_font = pygame.image.load("_data/uf8x9.png").convert()
-_uf8x9_font.set_colorkey((255, 255, 255))  # Make white transparent
-_uf8x9_font = _uf8x9_font.convert_alpha()
-
-# Font character cache {unicode_code: (surface, width)}
+# Glyphs are boolean masks cut from the font sheet; white is transparent.
+# The sheet is loaded when the first character is drawn or measured.
+_uf8x9_font = None
+
+def _font_sheet():
+    global _uf8x9_font
+    if _uf8x9_font is None:
+        rgb = pygame.surfarray.array3d(
+            pygame.image.load(os.path.join(_DATA_DIR, "font8x9.png")))
+        _uf8x9_font = ~_np.all(rgb == 255, axis=2).T
+    return _uf8x9_font
+
+# Font character cache {unicode_code: (mask, width)}
 _font_cache = {}
 
 # Font grid constants
@@ -245,6 +830,10 @@ GAP = 1
 FONT_CELL_WIDTH = GLYPH_WIDTH + GAP*2
 FONT_CELL_HEIGHT = GAP + GLYPH_HEIGHT + GAP*2
 
+# The sheet glyphs carry a 1px gap above and to the left
+_default_font._height = GLYPH_HEIGHT
+_default_font._origin = (-GAP, -GAP)
+
 # Line definitions (start code, chars per line)
 LINE_DEFS = [
     (0x0020, 16),  # Space to / (16 chars)
@@ -256,7 +845,7 @@ LINE_DEFS = [
 ]
 
 def _get_glyph(font: GintFont, char: str):
-    """Get glyph surface and width with 1px gap grid layout"""
+    """Get glyph mask and width with 1px gap grid layout"""
     code = ord(char)
     
     if code in _font_cache:
@@ -279,41 +868,190 @@ def _get_glyph(font: GintFont, char: str):
     # Calculate coordinates in texture (with 1px gaps)
     x = (col * FONT_CELL_WIDTH) - GAP  # Compensate left offset
     y = (row * FONT_CELL_HEIGHT) - GAP  # Compensate top offset
-    
-    try:
-        # Extract glyph (8x9 area inside cell)
-        glyph = _uf8x9_font.subsurface(
-            x + GAP,  # Original GAP compensation
-            y + GAP,   # Original GAP compensation
-            GLYPH_WIDTH + GAP, 
-            GLYPH_HEIGHT + GAP
-        )
-    except ValueError:
+
+    # Extract glyph (8x9 area inside cell)
+    glyph = _font_sheet()[y + GAP:y + GAP + GLYPH_HEIGHT + GAP,
+                          x + GAP:x + GAP + GLYPH_WIDTH + GAP]
+    if glyph.shape != (GLYPH_HEIGHT + GAP, GLYPH_WIDTH + GAP):
         return _get_glyph(font, ' ')  # Fallback
-    
+
     # Calculate proportional width
-    width = GLYPH_WIDTH + 1
-    for x_pos in reversed(range(GLYPH_WIDTH)):
-        if any(glyph.get_at((x_pos, y_pos))[3] > 0 
-               for y_pos in range(GLYPH_HEIGHT)):
-            width = x_pos + 1
-            break
-    
+    cols = _np.flatnonzero(glyph[:GLYPH_HEIGHT, :GLYPH_WIDTH].any(axis=0))
+    width = int(cols[-1]) + 1 if len(cols) else GLYPH_WIDTH + 1
+
     _font_cache[code] = (glyph, width)
     return glyph, width
 
+# Glyph atlas: all the glyphs of a font stacked in one array, indexed by slot.
+# Blocks map code point ranges to slots; they are sorted by start so that the
+# block of a code point is found by bisection (_np.searchsorted).
+def _load_sheet_atlas(font: GintFont):
+    """Atlas of the built-in font, cut from the font sheet"""
+    start = LINE_DEFS[0][0]
+    count = LINE_DEFS[-1][0] + LINE_DEFS[-1][1] - start
+    glyphs = [_get_glyph(font, chr(c)) for c in range(start, start + count)]
+    font._glyphs = _np.stack([glyph for glyph, _ in glyphs])
+    font._widths = _np.array([width for _, width in glyphs], dtype=_np.int64)
+    font._block_starts = _np.array([start], dtype=_np.int64)
+    font._block_lengths = _np.array([count], dtype=_np.int64)
+    font._block_slots = _np.array([0], dtype=_np.int64)
+    font._fallback_slot = 0  # Space
+
+def _decode_topti(font: GintFont):
+    """Atlas of a topti font: unpack the bit-packed glyph data"""
+    blocks = _np.frombuffer(bytes(font.blocks), dtype='>u4')[:font.block_count]
+    blocks = blocks.astype(_np.int64)
+    starts, lengths = blocks >> 12, blocks & 0xfff
+    slots = _np.concatenate(([0], _np.cumsum(lengths[:-1]))).astype(_np.int64)
+    order = _np.argsort(starts, kind='stable')
+    font._block_starts = starts[order]
+    font._block_lengths = lengths[order]
+    font._block_slots = slots[order]
+    font._fallback_slot = -1  # Unknown characters are skipped, like gint does
+
+    count, height = font.glyph_count, font.data_height
+    if font.prop & 1:
+        widths = _np.frombuffer(bytes(font.glyph_width), dtype=_np.uint8)
+        widths = widths[:count].astype(_np.int64)
+        words = (widths * height + 31) >> 5
+    else:
+        widths = _np.full(count, font.width, dtype=_np.int64)
+        words = _np.full(count, font.storage_size, dtype=_np.int64)
+    # Glyphs are stored back to back, each padded to 4 bytes. glyph_index
+    # only lets the calculator seek without summing, the offsets are the same.
+    offsets = _np.concatenate(([0], _np.cumsum(words[:-1])))
+    offsets = offsets.astype(_np.int64) * 32
+
+    # Row-major bits, MSB first: bit (r, c) of glyph i is at offset + r*w + c
+    bits = _np.unpackbits(_np.frombuffer(bytes(font.data), dtype=_np.uint8))
+    w = widths[:, None, None]
+    rows = _np.arange(height)[None, :, None]
+    cols = _np.arange(max(int(widths.max(initial=0)), 1))[None, None, :]
+    index = _np.broadcast_to(offsets[:, None, None] + rows * w + cols,
+                            (count, height, cols.shape[2]))
+    inside = _np.broadcast_to(cols < w, index.shape)
+    font._glyphs = _np.zeros(index.shape, dtype=bool)
+    font._glyphs[inside] = bits[index[inside]]
+    font._widths = widths
+
+_ATLAS_FIELDS = ("_glyphs", "_widths", "_block_starts", "_block_lengths",
+                 "_block_slots", "_fallback_slot")
+
+def _font_atlas(font: GintFont) -> GintFont:
+    """Decode the glyph atlas of a font if not done yet"""
+    if font._glyphs is None:
+        if font is _default_font:
+            _load_sheet_atlas(font)
+            return font
+        key = None
+        if _resident is not None:
+            h = _hashlib.blake2b(digest_size=16)
+            h.update(repr((font.prop, font.width, font.storage_size,
+                           font.glyph_count, font.data_height,
+                           font.block_count)).encode())
+            for data in (font.blocks, font.data, font.glyph_width):
+                h.update(bytes(data or b""))
+            key = "font:" + h.hexdigest()
+            atlas = _resident_get(key)
+            if atlas is not None:
+                for name, value in zip(_ATLAS_FIELDS, atlas):
+                    setattr(font, name, value)
+                return font
+        _decode_topti(font)
+        if key is not None:
+            _resident[key] = tuple(getattr(font, name) for name in _ATLAS_FIELDS)
+    return font
+
+def _font_slots(font: GintFont, text: str):
+    """Atlas slot of every character of a string; -1 for missing glyphs"""
+    codes = _np.frombuffer(text.encode('utf-32-le'), dtype=_np.uint32)
+    codes = codes.astype(_np.int64)
+    if not len(font._block_starts):
+        return _np.full(len(codes), font._fallback_slot)
+    block = _np.searchsorted(font._block_starts, codes, side='right') - 1
+    offset = codes - font._block_starts[block]
+    found = (block >= 0) & (offset < font._block_lengths[block])
+    return _np.where(found, font._block_slots[block] + offset,
+                     font._fallback_slot)
+
+# Rendered strings {(font, text): mask}, least recently used first. Masks do
+# not depend on the color, which is only applied when writing to VRAM.
+_text_cache = _OrderedDict()
+_TEXT_CACHE_SIZE = 256
+_text_cache_hits = 0
+_text_cache_misses = 0
+# Characters drawn since the start, for the profiling tools
+_glyphs_drawn = 0
+
+def _text_mask(font: GintFont, text: str):
+    """Mask of a whole string, to be drawn with its corner at font._origin"""
+    global _text_cache_hits, _text_cache_misses
+    key = (font, text)
+    mask = _text_cache.get(key)
+    if mask is not None:
+        _text_cache_hits += 1
+        _text_cache.move_to_end(key)
+        return mask
+    _text_cache_misses += 1
+
+    _font_atlas(font)
+    slots = _font_slots(font, text)
+    slots = slots[slots >= 0]
+
+    # Place all glyphs at their cursor positions in one go
+    glyphs = font._glyphs[slots]
+    if not len(slots):
+        mask = _np.zeros((glyphs.shape[1], 0), dtype=bool)
+    else:
+        advances = font._widths[slots] + font.char_spacing
+        xs = _np.concatenate(([0], _np.cumsum(advances[:-1])))
+        index, rows, cols = _np.nonzero(glyphs)
+        mask = _np.zeros((glyphs.shape[1], int(xs[-1]) + glyphs.shape[2]),
+                        dtype=bool)
+        mask[rows, xs[index] + cols] = True
+
+    _text_cache[key] = mask
+    if len(_text_cache) > _TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return mask
+
+def _text_cache_stats() -> dict:
+    """Hit and miss counts of the rendered text cache"""
+    total = _text_cache_hits + _text_cache_misses
+    return {
+        'hits': _text_cache_hits,
+        'misses': _text_cache_misses,
+        'hit_rate': _text_cache_hits / total if total else 0.0,
+        'entries': len(_text_cache),
+    }
+
+def _font_advances(font: GintFont) -> dict:
+    """Table of glyph width + char_spacing for every character of a font"""
+    if font._advances is None:
+        _font_atlas(font)
+        spacing = font.char_spacing
+        widths = font._widths.tolist()
+        font._advances = {}
+        for start, length, slot in zip(font._block_starts.tolist(),
+                                       font._block_lengths.tolist(),
+                                       font._block_slots.tolist()):
+            font._advances.update((chr(start + i), widths[slot + i] + spacing)
+                                  for i in range(length))
+        if font._fallback_slot >= 0:
+            font._fallback_advance = widths[font._fallback_slot] + spacing
+    return font._advances
+
 def dsize(text: str, font: Optional[GintFont]) -> Tuple[int, int]:
     """Get the width and height of rendered text."""
-    if not text:
-        return 0, GLYPH_HEIGHT
-    
     font = font or _current_font
-    
-    widths = [_get_glyph(font, c)[1] for c in text]
+    if not text:
+        return 0, font._height
+
+    advances = _font_advances(font)
+
     # Sum of glyph widths + spacing between them
-    total_width = sum(widths) + (len(text) - 1) * font.char_spacing
-    
-    return total_width, GLYPH_HEIGHT
+    total_width = sum(map(advances.get, text, _repeat(font._fallback_advance)))
+    return total_width - font.char_spacing, font._height
 
 def dnsize(text: str, size: int, font: Optional[GintFont]) -> Tuple[int, int]:
     """Get the width and height of a prefix of a rendered text."""
@@ -334,28 +1072,17 @@ def drsize(text: str, font: Optional[GintFont], width: int) -> Tuple[int, int]:
         may fail. This is a known issue.
     """
     font = font or _current_font
-    byte_offset = 0
-    actual_width = 0
-    
-    for i, char in enumerate(text):
-        glyph_w = _get_glyph(font, char)[1]
-        
-        # Width this character would occupy (including preceding space)
-        char_total_w = glyph_w + (font.char_spacing if i > 0 else 0)
-        
-        if actual_width + char_total_w > width:
-            break # Character does not fit, stop here.
-        
-        # It fits, commit the changes
-        actual_width += char_total_w
-        byte_offset += len(char.encode('utf-8'))
-        
-    return byte_offset, actual_width
+    prefix = font.text_prefix(text)
+    count = font.text_fit(prefix, width)
+
+    byte_offset = count if text.isascii() else len(text[:count].encode('utf-8'))
+    return byte_offset, font.text_width(prefix, 0, count)
 
 
 # Updated text rendering with precise spacing
 def dtext(x: int, y: int, color: int, text: str,
           align=DTEXT_LEFT, valign=DTEXT_TOP):
+    global _glyphs_drawn
     if color == C_NONE or not text:
         return
     
@@ -379,22 +1106,15 @@ def dtext(x: int, y: int, color: int, text: str,
     elif valign == DTEXT_BOTTOM:
         y -= total_height
     
-    # Draw each character
-    cursor_x = x
-    for char in text:
-        glyph, width = _get_glyph(font, char)
-        
-        # Create colored glyph
-        mask = pygame.mask.from_surface(glyph)
-        colored = pygame.Surface(glyph.get_size(), pygame.SRCALPHA)
-        mask.to_surface(colored, setcolor=_to_rgb(color), unsetcolor=(0,0,0,0))
-        
-        vram.blit(colored, (cursor_x - GAP, y - GAP))
-        cursor_x += width + font.char_spacing
+    # Draw the whole string at once
+    dx, dy = font._origin
+    _np_mask(x + dx, y + dy, _text_mask(font, text), color)
+    _glyphs_drawn += len(text)
 
 
 def dtext_opt(x: int, y: int, fg: int, bg: int, 
             halign: str, valign: str, text: str, size: int = -1):
+    global _glyphs_drawn
     if not text:
         return
     
@@ -417,33 +1137,15 @@ def dtext_opt(x: int, y: int, fg: int, bg: int,
     
     # Draw background (if requested)
     if bg != C_NONE:
-        bg_rect = pygame.Rect(
-            x - 1, y - 1,
-            total_width + 2, total_height + 2
-        )
-        pygame.draw.rect(vram, _to_rgb(bg), bg_rect)
+        _np_rect(x - 1, y - 1, x + total_width, y + total_height, bg)
     
     # Draw text characters
-    cursor_x = x
-    for char in text:
-        glyph, width = _get_glyph(font, char)
-        
-        # Create colored glyph
-        mask = pygame.mask.from_surface(glyph)
-        colored = pygame.Surface(glyph.get_size(), pygame.SRCALPHA)
-        mask.to_surface(colored, setcolor=_to_rgb(fg), unsetcolor=(0,0,0,0))
-        
-        vram.blit(colored, (cursor_x - GAP, y - GAP))
-        cursor_x += width + font.char_spacing
+    dx, dy = font._origin
+    _np_mask(x + dx, y + dy, _text_mask(font, text), fg)
+    _glyphs_drawn += len(text)
 
 # Key Events
 
-pygame.event.set_allowed([
-    QUIT, KEYDOWN, KEYUP,
-    ACTIVEEVENT, VIDEORESIZE, VIDEOEXPOSE,
-    MOUSEBUTTONDOWN, MOUSEBUTTONUP, MOUSEMOTION
-])
-
 # Key constants
 KEY_F1		= 0x91
 KEY_F2		= 0x92
@@ -611,7 +1313,6 @@ _key_mapping = {
 # State tracking
 _key_states = {}
 _modifiers = {'shift': False, 'alpha': False}
-_last_key_time = 0
 _repeat_delay = 400  # ms
 _repeat_interval = 40  # ms
 
@@ -656,140 +1357,239 @@ def _update_modifiers():
     # Alpha state tracking (using Caps Lock as example)
     _modifiers['alpha'] = bool(pygame.key.get_mods() & KMOD_CAPS)
 
-# Reverse mapping from gint keys to Pygame keys
-_inverse_key_mapping = {}
-for pg_key, custom_key in _key_mapping.items():
-    if custom_key not in _inverse_key_mapping:
-        _inverse_key_mapping[custom_key] = []
-    _inverse_key_mapping[custom_key].append(pg_key)
 
-# Add special case for mouse position tracking
-MOUSE_X = 2000
-MOUSE_Y = 2001
-_inverse_key_mapping.update({
-    MOUSE_X: [K_UNKNOWN],  # Placeholders
-    MOUSE_Y: [K_UNKNOWN]
-})
+def _ticks() -> int:
+    """Milliseconds, for key repeats and timeouts"""
+    return int(time.monotonic() * 1000)
+
+# Events read from pygame and not yet delivered to the program, oldest first
+_events = _deque()
+# Key state as of the last event delivered: like on the calculator, keydown()
+# reflects the events read by pollevent() or clearevents(), not the keyboard
+# itself. Flip bits record presses and releases until cleareventflips().
+_keys_down = bytearray(256)
+_keys_pressed = bytearray(256)
+_keys_released = bytearray(256)
+_NO_KEYS = bytes(256)
+# Returned whenever the queue is empty
+_NONE_EVENT = NoneEvent()
+
+def _pump():
+    """Move the pending pygame events to the event queue"""
+    _update_modifiers()
+    for event in pygame.event.get():
+        _translate(event)
 
+def _translate(event):
+    """Queue the gint event of a pygame event, if any"""
+    if event.type == QUIT:
+        _events.append(KeyEvent(KEYEV_DOWN, KEY_EXIT))
+    
+    elif event.type == VIDEOEXPOSE:  # <-- Triggered when window needs redraw
+        _present([(0, 0, DWIDTH, DHEIGHT)])
 
-def pollevent():
-    global _key_states
-    _update_modifiers()
+    elif event.type == VIDEORESIZE:
+        _fit_window()
+        _present([(0, 0, DWIDTH, DHEIGHT)])
+
+    elif event.type == ACTIVEEVENT:
+        # Redraw when window gains focus (optional)
+        if event.gain == 1:  # 1 = window activated
+            _present([(0, 0, DWIDTH, DHEIGHT)])
     
-    for event in pygame.event.get():
-        if event.type == QUIT:
-            return KeyEvent(KEYEV_DOWN, KEY_EXIT)
+    # Handle mouse events as touch input
+    elif event.type == MOUSEBUTTONDOWN:
+        if _view.collidepoint(event.pos):  # Not in the borders of the window
+            _events.append(KeyEvent(KEYEV_TOUCH_DOWN, None, _touch_pos(event.pos)))
         
-        elif event.type == VIDEOEXPOSE:  # <-- Triggered when window needs redraw
-            dupdate()
-
-        elif event.type == ACTIVEEVENT:
-            # Redraw when window gains focus (optional)
-            if event.gain == 1:  # 1 = window activated
-                dupdate()
+    elif event.type == MOUSEBUTTONUP:
+        _events.append(KeyEvent(KEYEV_TOUCH_UP, None, _touch_pos(event.pos)))
         
-        # Handle mouse events as touch input
-        elif event.type == MOUSEBUTTONDOWN:
-            return KeyEvent(KEYEV_TOUCH_DOWN, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
-            
-        elif event.type == MOUSEBUTTONUP:
-            return KeyEvent(KEYEV_TOUCH_UP, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
+    elif event.type == MOUSEMOTION:
+        if event.buttons[0]:  # Left mouse button dragged
+            _events.append(KeyEvent(KEYEV_TOUCH_DRAG, None, _touch_pos(event.pos)))
+        
+    elif event.type == KEYDOWN:
+        # Capture Print Screen key to save VRAM
+        if event.key == pygame.K_PRINTSCREEN:  # <-- Add this block
+            _screenshot("screenshot.png")
+            return  # Skip further processing for this event
+
+        # F12 shows or hides the performance overlay
+        if event.key == pygame.K_F12 and _hud is not None:
+            _hud.toggle()
+            return
             
-        elif event.type == MOUSEMOTION:
-            if event.buttons[0]:  # Left mouse button dragged
-                return KeyEvent(KEYEV_TOUCH_DRAG, None, (event.pos[0] // SCALE, event.pos[1] // SCALE))
+        if event.key in _key_mapping:
+            _events.append(KeyEvent(KEYEV_DOWN, _key_mapping[event.key]))
             
-        elif event.type == KEYDOWN:
-            # Capture Print Screen key to save VRAM
-            if event.key == pygame.K_PRINTSCREEN:  # <-- Add this block
-                pygame.image.save(vram, "screenshot.png")
-                continue  # Skip further processing for this event
-                
-            if event.key in _key_mapping:
-                mapped = _key_mapping[event.key]
-                _key_states[mapped] = {
-                    'time': pygame.time.get_ticks(),
-                    'last_repeat': pygame.time.get_ticks()
-                }
-                return KeyEvent(KEYEV_DOWN, mapped)
-                
-        elif event.type == KEYUP:
-            if event.key in _key_mapping:
-                mapped = _key_mapping[event.key]
-                if mapped in _key_states:
-                    del _key_states[mapped]
-                return KeyEvent(KEYEV_UP, mapped)
-    
-    return KeyEvent(KEYEV_NONE, None)
+    elif event.type == KEYUP:
+        if event.key in _key_mapping:
+            _events.append(KeyEvent(KEYEV_UP, _key_mapping[event.key]))
+
+def _deliver(ev: KeyEvent) -> KeyEvent:
+    """Apply an event to the key state as the program reads it"""
+    if _latency is not None:
+        _latency.input(ev)
+    if ev.type == KEYEV_DOWN:
+        _keys_down[ev.key] = 1
+        _keys_pressed[ev.key] = 1
+        _key_states[ev.key] = {'time': ev.time, 'last_repeat': ev.time}
+    elif ev.type == KEYEV_UP:
+        _keys_down[ev.key] = 0
+        _keys_released[ev.key] = 1
+        _key_states.pop(ev.key, None)
+    return ev
+
+def _poll() -> KeyEvent:
+    """Next event of the queue, reading pygame when it is empty"""
+    if _launcher is not None:
+        _launcher.check()
+    if not _events:
+        if _HEADLESS:
+            # No input device: the queue is always empty
+            return _NONE_EVENT
+        if screen is None:
+            _open_display()
+        _pump()
+        if not _events:
+            return _NONE_EVENT
+    return _deliver(_events.popleft())
+
+def pollevent():
+    if _input_log is not None:
+        return _input_log.pollevent()
+    return _poll()
 
 def getkey() -> KeyEvent:
     return getkey_opt(GETKEY_DEFAULT, None)
 
 def getkey_opt(options: int, timeout_ms: Optional[int] = 2000) -> KeyEvent:
-    start_time = pygame.time.get_ticks()
-    
+    if _input_log is not None:
+        ev = _input_log.getkey_opt(timeout_ms)
+    else:
+        ev = _wait_key(timeout_ms)
+    if ev.key == KEY_EXIT and not ev.shift and not ev.alpha:
+        if _launcher is None:  # The launcher keeps the window
+            pygame.quit()
+        sys.exit()
+    return ev
+
+def _wait_key(timeout_ms: Optional[int]) -> KeyEvent:
+    """Next key event, or the NONE event after timeout_ms"""
+    if _HEADLESS:
+        # Nobody will ever press a key; waiting forever ends the program
+        if timeout_ms is None:
+            sys.exit()
+        return _NONE_EVENT
+    if screen is None:
+        _open_display()
+
+    deadline = None if timeout_ms is None else _ticks() + timeout_ms
+
     while True:
         # Process existing events first
-        ev = pollevent()
+        ev = _poll()
         if ev.type != KEYEV_NONE:
-            if ev.key == KEY_EXIT and not ev.shift and not ev.alpha:
-                pygame.quit()
-                sys.exit()
             return ev
-        
+
         # Check timeout
-        if timeout_ms is not None and (pygame.time.get_ticks() - start_time) > timeout_ms:
-            return KeyEvent(KEYEV_NONE, None)
-        
-        # Handle key repeats
-        current_time = pygame.time.get_ticks()
-        for key in list(_key_states.keys()):
-            state = _key_states[key]
-            if (current_time - state['time']) > _repeat_delay:
-                if (current_time - state['last_repeat']) > _repeat_interval:
-                    _key_states[key]['last_repeat'] = current_time
-                    return KeyEvent(KEYEV_HOLD, key)
-        
-        # Prevent CPU hogging
-        pygame.time.wait(10)
+        now = _ticks()
+        if deadline is not None and now >= deadline:
+            return _NONE_EVENT
+
+        # Handle key repeats: the first one _repeat_delay after the press,
+        # then every _repeat_interval
+        wake = deadline
+        for key, state in _key_states.items():
+            due = max(state['time'] + _repeat_delay,
+                      state['last_repeat'] + _repeat_interval)
+            if now >= due:
+                state['last_repeat'] = now
+                return KeyEvent(KEYEV_HOLD, key)
+            if wake is None or due < wake:
+                wake = due
+
+        # Sleep until an event arrives or the next repeat or timeout is due
+        if _launcher is not None:
+            # Wake up for the launcher to notice changed files
+            wake = min(wake, now + 250) if wake is not None else now + 250
+        if wake is None:
+            event = pygame.event.wait()
+        else:
+            event = pygame.event.wait(max(wake - now, 1))
+        if event.type != NOEVENT:
+            _update_modifiers()
+            _translate(event)
 
 def keydown(key: int) -> bool:
     """Check if a specific key is currently pressed"""
-    pressed = pygame.key.get_pressed()
-    return any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, []))
+    try:
+        return _keys_down[key] == 1
+    except (IndexError, TypeError):
+        return False
 
 def keydown_all(*keys: int) -> bool:
     """Check if all specified keys are pressed"""
-    pressed = pygame.key.get_pressed()
-    return all(any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, [])) 
-                for key in keys)
+    return all(keydown(key) for key in keys)
 
 def keydown_any(*keys: int) -> bool:
     """Check if any of specified keys are pressed"""
-    pressed = pygame.key.get_pressed()
-    return any(any(pressed[pg_key] for pg_key in _inverse_key_mapping.get(key, [])) 
-               for key in keys)
+    return any(keydown(key) for key in keys)
+
+def keypressed(key: int) -> bool:
+    """Check if a key was pressed since the last cleareventflips()"""
+    try:
+        return _keys_pressed[key] == 1
+    except (IndexError, TypeError):
+        return False
+
+def keyreleased(key: int) -> bool:
+    """Check if a key was released since the last cleareventflips()"""
+    try:
+        return _keys_released[key] == 1
+    except (IndexError, TypeError):
+        return False
 
 def clearevents():
-    """Clear all pending events from the queue"""
-    pygame.event.clear()
+    """Read all pending events, updating the key state"""
+    if _input_log is not None:
+        _input_log.clearevents()
+        return
+    _drain()
+
+def _drain(recorder=None):
+    """Deliver all pending events, passing them to the recorder if any"""
+    if not _HEADLESS:
+        if screen is None:
+            _open_display()
+        _pump()
+    while _events:
+        ev = _deliver(_events.popleft())
+        if recorder is not None:
+            recorder.write(ev)
 
 def cleareventflips():
-    global _key_states
-    global _modifiers
-    
-    _key_states = {}
-    _modifiers = {'shift': False, 'alpha': False}
+    """Forget the presses and releases seen so far"""
+    _keys_pressed[:] = _NO_KEYS
+    _keys_released[:] = _NO_KEYS
 
 # --------------------------------------------------------------
 # Image stuff
-IMAGE_MONO = 0
-IMAGE_RGB565 = 1
-IMAGE_RGB565A = 2
-IMAGE_P8_RGB565 = 3
-IMAGE_P8_RGB565A = 4
-IMAGE_P4_RGB565 = 5
-IMAGE_P4_RGB565A = 6
+# Profile ids are those of gint on the fx-CG, as emitted by fxconv --py
+IMAGE_RGB565 = 0
+IMAGE_RGB565A = 1
+IMAGE_P8_RGB565 = 4
+IMAGE_P8_RGB565A = 5
+IMAGE_P4_RGB565 = 6
+IMAGE_P4_RGB565A = 3
+
+# Transparent value of each alpha profile (pixel value or palette index)
+_IMAGE_ALPHA = {
+    IMAGE_RGB565A: 0x0001,
+    IMAGE_P8_RGB565A: 0x80,
+    IMAGE_P4_RGB565A: 0,
+}
 
 class Image:
     """Represents a graphical image in VRAM"""
@@ -803,143 +1603,83 @@ class Image:
         self.stride = stride
         self.data = data
         self.palette = palette
-        self.surface = self._decode_image()
-
-    def _decode_image(self) -> pygame.Surface:
-        surface = pygame.Surface((self.width, self.height), pygame.SRCALPHA)
-        pixels = pygame.PixelArray(surface)
-        
-        if self.profile == IMAGE_MONO:
-            # 1‑bpp: bit 0 = black, bit 1 = white
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    byte = self.data[row + (x >> 3)]
-                    bit  = (byte >> (7 - (x & 7))) & 1
-                    pixels[x, y] = (255,255,255) if bit else (0,0,0)
-        
-        elif self.profile == IMAGE_RGB565:
-            # Decode 16bpp direct color
-            for y in range(self.height):
-                for x in range(self.width):
-                    px_idx = (y * self.width + x) * 2
-                    rgb565 = struct.unpack('>H', self.data[px_idx:px_idx+2])[0]
-                    r = (rgb565 >> 11) * 255 // 31
-                    g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                    b = (rgb565 & 0x1F) * 255 // 31
-                    pixels[x, y] = (r, g, b)
-        
-        elif self.profile == IMAGE_RGB565A:
-            # 16‑bpp with 1-bit alpha
-            ALPHA_VAL = 0x0001   # as in fxconv’s CgProfile
-            for y in range(self.height):
-                for x in range(self.width):
-                    off = y * self.stride + x*2
-                    c = struct.unpack('>H', self.data[off:off+2])[0]
-                    if c == ALPHA_VAL:
-                        # leave pixel transparent
-                        continue
-                    # if c collided with alpha value, fxconv flips its low‑bit
-                    # but you can ignore that here
-                    r = (c >> 11) * 255 // 31
-                    g = ((c >> 5) & 0x3F) * 255 // 63
-                    b = (c & 0x1F) * 255 // 31
-                    pixels[x, y] = (r, g, b, 255)
-        
-        elif self.profile in (IMAGE_P8_RGB565, IMAGE_P8_RGB565A):
-            # 8‑bpp indexed
-            PALETTE_BASE = 0x80  # for RGB565; 0x81 if you’re using the ‘a’ profile
-            ALPHA_IDX    = 0x80  # only for IMAGE_P8_RGB565A
-            # build 256‑entry palette from your 2‑byte‑per‑entry self.palette
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    c = self.data[row + x]
-                    if self.profile == IMAGE_P8_RGB565A and c == ALPHA_IDX:
-                        continue
-                    idx = c - PALETTE_BASE
-                    pixels[x, y] = palette[idx]
-
+        # Decoded on first draw (see _rgb565)
+        self._pixels = None
+        self._alpha = None
+
+    def _decode_image(self):
+        """Decode the data to RGB565 pixels and the profile's raw values"""
+        w, h, stride = self.width, self.height, self.stride
+        rows = _np.frombuffer(self.data, dtype=_np.uint8)[:h * stride]
+        rows = rows.reshape(h, stride)
+
+        if self.profile in (IMAGE_RGB565, IMAGE_RGB565A):
+            # Big-endian 16-bit pixels, rows padded to 4 bytes
+            pixels = rows[:, :2 * w].copy().view('>u2').astype(_np.uint16)
+            return pixels, pixels
+
+        palette = _np.zeros(0, dtype=_np.uint16)
+        if self.palette is not None:
+            palette = _np.frombuffer(self.palette, dtype='>u2')
+            palette = palette.astype(_np.uint16)
+
+        if self.profile in (IMAGE_P8_RGB565, IMAGE_P8_RGB565A):
+            # Index c refers to palette entry (c - 0x80) mod 256
+            index = rows[:, :w]
+            lut = _np.zeros(256, dtype=_np.uint16)
+            count = min(len(palette), 256)
+            lut[(0x80 + _np.arange(count)) & 0xff] = palette[:count]
         elif self.profile in (IMAGE_P4_RGB565, IMAGE_P4_RGB565A):
-            # 4‑bpp indexed: two pixels per byte
-            PALETTE_BASE = 0     # for non‑alpha; 1 for the ‘a’ profile
-            ALPHA_IDX    = 0     # only for IMAGE_P4_RGB565A
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    byte = self.data[row + (x >> 1)]
-                    # even pixel in high nibble, odd in low
-                    nibble = (byte >> 4) if (x & 1)==0 else (byte & 0xF)
-                    if self.profile == IMAGE_P4_RGB565A and nibble == ALPHA_IDX:
-                        continue
-                    idx = nibble - PALETTE_BASE
-                    pixels[x, y] = palette[idx]
-
-        elif self.profile == IMAGE_P4_RGB565:
-            # Decode 4bpp palette-based image
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-            
-            for y in range(self.height):
-                for x in range(self.width):
-                    byte_idx = y * self.stride + (x // 2)
-                    byte = self.data[byte_idx]
-                    nibble = (byte >> 4) if x % 2 == 0 else (byte & 0x0F)
-                    
-                    pixels[x, y] = palette[nibble]
-
-        
-        
-        elif self.profile == IMAGE_P8_RGB565:
-            # 8‑bit palette‑based image -----------------------------------------
-            # The converter stores indices that start at 0x80 (palette_base)      # ←
-            # so we must subtract that offset before looking them up.             #
-            PALETTE_BASE = 0x80                                                   # |
-            palette = []
-            for i in range(0, len(self.palette), 2):
-                rgb565 = struct.unpack('>H', self.palette[i:i+2])[0]
-                r = (rgb565 >> 11) * 255 // 31
-                g = ((rgb565 >> 5) & 0x3F) * 255 // 63
-                b = (rgb565 & 0x1F) * 255 // 31
-                palette.append((r, g, b))
-
-            for y in range(self.height):
-                row = y * self.stride
-                for x in range(self.width):
-                    idx = self.data[row + x] - PALETTE_BASE
-                    pixels[x, y] = palette[idx]
-        
-        pixels.close()
-        return surface
+            # Two pixels per byte, even pixels in the high nibble
+            index = _np.empty((h, 2 * stride), dtype=_np.uint8)
+            index[:, 0::2] = rows >> 4
+            index[:, 1::2] = rows & 0x0f
+            index = index[:, :w]
+            lut = _np.zeros(16, dtype=_np.uint16)
+            count = min(len(palette), 16)
+            lut[:count] = palette[:count]
+        else:
+            raise ValueError(f"unknown image profile {self.profile}")
+        return lut[index], index
+
+    def _rgb565(self):
+        """Native RGB565 pixels and alpha mask (None if opaque) of the image"""
+        if self._pixels is None:
+            if _resident is not None:
+                key = _image_key(self)
+                cached = _resident_get(key)
+                if cached is not None:
+                    self._pixels, self._alpha = cached
+                    _resident[key] = cached
+                    return cached
+            self._pixels, raw = self._decode_image()
+            alpha = _IMAGE_ALPHA.get(self.profile)
+            if alpha is not None:
+                opaque = raw != alpha
+                if not opaque.all():
+                    self._alpha = opaque
+            if _resident is not None:
+                _resident[key] = (self._pixels, self._alpha)
+        return self._pixels, self._alpha
+
+def _image_key(img: Image) -> str:
+    """Content hash of everything that determines the decoded pixels"""
+    h = _hashlib.blake2b(digest_size=16)
+    h.update(f"{img.profile},{img.width},{img.height},{img.stride};".encode())
+    h.update(img.data)
+    if img.palette is not None:
+        h.update(img.palette)
+    return h.hexdigest()
 
 def image(profile: int, color_count: int, width: int, height: int, 
                 stride: int, data: bytearray, palette: bytearray) -> Image:
-    return Image(IMAGE_RGB565, profile, color_count, width, height, stride, data, palette)
+    return Image(profile, profile, color_count, width, height, stride, data, palette)
 
 def image_rgb565(width: int, height: int, data: bytes) -> Image:
     """
-    16‑bpp RGB565, tightly packed (no alpha, no padding)
+    16‑bpp RGB565, rows padded to 4 bytes (no alpha)
     """
-    stride = width * 2
+    stride = (width + 1) // 2 * 4
     return Image(
         format=IMAGE_RGB565,
         profile=IMAGE_RGB565,
@@ -953,9 +1693,9 @@ def image_rgb565(width: int, height: int, data: bytes) -> Image:
 
 def image_rgb565a(width: int, height: int, data: bytes) -> Image:
     """
-    16‑bpp RGB565 + 1‑bit alpha (alpha index == 0x0001)
+    16‑bpp RGB565 + 1‑bit alpha (alpha index == 0x0001), rows padded to 4 bytes
     """
-    stride = width * 2
+    stride = (width + 1) // 2 * 4
     return Image(
         format=IMAGE_RGB565A,
         profile=IMAGE_RGB565A,
@@ -1038,14 +1778,84 @@ def image_p4_rgb565a(width: int, height: int, data: bytes, palette: bytes) -> Im
 
 def dimage(x: int, y: int, img: Image):
     """Draw entire image at specified coordinates"""
-    vram.blit(img.surface, (x, y))
+    _np_blit(x, y, *img._rgb565())
 
 def dsubimage(x: int, y: int, img: Image,
              left: int, top: int, width: int, height: int):
     """Draw subregion of image"""
-    sub_rect = pygame.Rect(left, top, width, height)
-    sub_surf = img.surface.subsurface(sub_rect)
-    vram.blit(sub_surf, (x, y))
+    pixels, alpha = img._rgb565()
+    left = max(left, 0)
+    top = max(top, 0)
+    pixels = pixels[top:top+height, left:left+width]
+    if alpha is not None:
+        alpha = alpha[top:top+height, left:left+width]
+    _np_blit(x, y, pixels, alpha)
+
+# Sprite sheets: cells of an image drawn many at a time with dsprites(). The
+# cells are views into the decoded image, sliced once and reused every frame.
+
+class SpriteSheet:
+    """Cells of an image, given as a grid or as (x, y, w, h) rectangles"""
+    def __init__(self, img: Image, cell_width: int = 0, cell_height: int = 0,
+                 rects=None):
+        self.image = img
+        if rects is None:
+            columns = img.width // cell_width
+            rows = img.height // cell_height
+            rects = [(c * cell_width, r * cell_height, cell_width, cell_height)
+                     for r in range(rows) for c in range(columns)]
+        self.rects = [tuple(rect) for rect in rects]
+        # [(pixels, alpha, width, height)] per cell, sliced on first draw
+        self._cells = None
+
+    def __len__(self):
+        return len(self.rects)
+
+def _sprite_cells(sheet: SpriteSheet) -> list:
+    """Pixels, alpha mask (or None) and size of every cell of a sprite sheet"""
+    if sheet._cells is None:
+        pixels, alpha = sheet.image._rgb565()
+        cells = []
+        for x, y, w, h in sheet.rects:
+            cell = pixels[y:y+h, x:x+w]
+            mask = None if alpha is None else alpha[y:y+h, x:x+w]
+            if mask is not None and mask.all():
+                mask = None
+            cells.append((cell, mask, cell.shape[1], cell.shape[0]))
+        sheet._cells = cells
+    return sheet._cells
+
+def dsprites(sheet: SpriteSheet, sprites):
+    """Draw sprites given as [x0, y0, cell0, x1, y1, cell1, ...], in order"""
+    s = _batch_coords(sprites, 3)
+    cells = _sprite_cells(sheet)
+    left, top, right, bottom = _clip
+    dirty = [right, bottom, left, top]
+    pixels_drawn = 0
+    copyto = _np.copyto
+    for x, y, cell in s.tolist():
+        pixels, alpha, w, h = cells[cell]
+        x0 = max(x, left)
+        y0 = max(y, top)
+        x1 = min(x + w, right)
+        y1 = min(y + h, bottom)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        if x0 < dirty[0]: dirty[0] = x0
+        if y0 < dirty[1]: dirty[1] = y0
+        if x1 > dirty[2]: dirty[2] = x1
+        if y1 > dirty[3]: dirty[3] = y1
+        pixels_drawn += (x1 - x0) * (y1 - y0)
+        if x0 != x or y0 != y or x1 != x + w or y1 != y + h:
+            pixels = pixels[y0-y:y1-y, x0-x:x1-x]
+            if alpha is not None:
+                alpha = alpha[y0-y:y1-y, x0-x:x1-x]
+        if alpha is None:
+            vram[y0:y1, x0:x1] = pixels
+        else:
+            copyto(vram[y0:y1, x0:x1], pixels, where=alpha)
+    if dirty[0] < dirty[2]:
+        _mark_dirty(*dirty, pixels_drawn)
 
 #  --- Polyfill
     
@@ -1164,7 +1974,1588 @@ if not hasattr(sys, 'print_exception'):
         traceback.print_exception(type(exc), exc, exc.__traceback__, file=file)
     sys.print_exception = sys_print_exception
 
+#  --- Tools
+#
+# Simulator tools observe the program through its gint calls. An enabled tool
+# replaces the public functions it needs with wrappers at import, before the
+# program binds them with "from gint import *". Only outermost calls reach the
+# tool: the drect() done by drect_border() is part of the drect_border() call.
+
+import io as _io
+import json as _json
+import pickle as _pickle
+import atexit as _atexit
+import difflib as _difflib
+
+import sysconfig as _sysconfig
+
+# Code outside these is the program's (and its own modules')
+_SYSTEM_PATHS = tuple(p for p in {_sysconfig.get_path("stdlib"),
+                                  _sysconfig.get_path("purelib"),
+                                  _sysconfig.get_path("platlib")} if p)
+
+def _is_user_file(path: str) -> bool:
+    return not (path == __file__ or path.startswith("<frozen")
+                or path.startswith(_SYSTEM_PATHS))
+
+def _hooked(name: str, func, hook, depth: list):
+    def hooked(*args, **kwargs):
+        if depth[0]:
+            return func(*args, **kwargs)
+        depth[0] += 1
+        try:
+            return hook(name, func, args, kwargs)
+        finally:
+            depth[0] -= 1
+    hooked.__name__ = hooked.__qualname__ = name
+    hooked.__doc__ = func.__doc__
+    hooked.__wrapped__ = func
+    return hooked
+
+def _hook_api(names, hook):
+    """Route calls to the named functions through hook(name, func, args, kwargs)"""
+    depth = [0]
+    g = globals()
+    for name in names:
+        g[name] = _hooked(name, g[name], hook, depth)
+
+# Display lists. GINT_RECORD=<file> saves the drawing calls of every frame:
+# the file is a sequence of pickled records, resources (images, fonts, sprite
+# sheets) when they are first used and ("frame", calls) at each dupdate(), each
+# call being a pickled (opcode, args, kwargs). GINT_SKIP_IDENTICAL=1 defers
+# drawing to dupdate() and skips frames whose display list is the same as the
+# previous one, when the previous one left the VRAM unchanged. Calls are kept
+# as plain (opcode, args, kwargs) tuples, with buffers copied and resources
+# compared by identity, and only pickled for GINT_RECORD. dfont() and
+# dwindow_set() still apply at once, since the program can read what they set;
+# deferred calls are drawn with the state they were made in.
+
+_DL_MAGIC = b"GINTDL1\n"
+_DRAW_CALLS = (
+    "dclear", "dpixel", "drect", "drect_border", "dline", "dhline", "dvline",
+    "dcircle", "dellipse", "dpoly", "dpixels", "drects", "dlines", "dtext",
+    "dtext_opt", "dimage", "dsubimage", "dsprites", "dfont", "dwindow_set",
+)
+_DRAW_OPCODES = {name: op for op, name in enumerate(_DRAW_CALLS)}
+# Every public function, for the tools that count calls
+_GINT_CALLS = _DRAW_CALLS + (
+    "dupdate", "dgetpixel", "dwindow_get", "dsize", "dnsize", "drsize",
+    "pollevent", "getkey", "getkey_opt", "keydown", "keydown_all",
+    "keydown_any", "keypressed", "keyreleased", "clearevents",
+    "cleareventflips",
+)
+
+# Calls that only set the drawing state
+_STATE_CALLS = ("dfont", "dwindow_set")
+# Calls that take sequences the program may change after the call
+_SEQUENCE_CALLS = ("dpoly", "dpixels", "drects", "dlines", "dsprites")
+
+def _draw_state() -> tuple:
+    """Drawing state that carries over from one frame to the next"""
+    return _current_font, _dwindow
+
+def _frozen(arg):
+    """A call argument the program cannot change after the call"""
+    if isinstance(arg, (bytearray, memoryview)):
+        return bytes(arg)
+    if isinstance(arg, list):
+        return tuple(arg)
+    if isinstance(arg, _np.ndarray):
+        return tuple(arg.ravel().tolist())
+    return arg
+
+def _set_draw_state(state: tuple):
+    global _current_font, _dwindow, _clip
+    _current_font, _dwindow = state
+    left, top, right, bottom = _dwindow
+    _clip = (max(left, 0), max(top, 0), min(right, DWIDTH), min(bottom, DHEIGHT))
+
+class _DisplayList:
+    """Pickling of draw calls, with resources referenced by number"""
+    def __init__(self):
+        self.objects = {0: _default_font}
+        self.numbers = {id(_default_font): 0}
+
+    def dump(self, op: int, args: tuple, kwargs: dict) -> bytes:
+        buffer = _io.BytesIO()
+        pickler = _pickle.Pickler(buffer, protocol=4)
+        pickler.fast = True  # No memo, so that equal calls give equal bytes
+        pickler.persistent_id = self._persistent_id
+        pickler.dump((op, args, kwargs))
+        return buffer.getvalue()
+
+    def load(self, data: bytes) -> tuple:
+        unpickler = _pickle.Unpickler(_io.BytesIO(data))
+        unpickler.persistent_load = self.objects.__getitem__
+        return unpickler.load()
+
+    def resource(self, record: tuple):
+        """Create the object described by a resource record"""
+        kind, number, args = record
+        if kind == "image":
+            obj = Image(*args)
+        elif kind == "font":
+            obj = GintFont(*args)
+        else:
+            obj = SpriteSheet(self.objects[args[0]], rects=args[1])
+        self.objects[number] = obj
+        self.numbers[id(obj)] = number
+
+    def _persistent_id(self, obj):
+        if not isinstance(obj, (Image, GintFont, SpriteSheet)):
+            return None
+        number = self.numbers.get(id(obj))
+        if number is None:
+            number = len(self.objects)
+            if isinstance(obj, Image):
+                record = ("image", number, (obj.format, obj.profile,
+                          obj.color_count, obj.width, obj.height, obj.stride,
+                          bytes(obj.data), None if obj.palette is None
+                          else bytes(obj.palette)))
+            elif isinstance(obj, GintFont):
+                record = ("font", number, tuple(
+                    bytes(v) if isinstance(v, (bytearray, memoryview)) else v
+                    for v in (obj.prop, obj.line_height, obj.data_height,
+                              obj.block_count, obj.glyph_count,
+                              obj.char_spacing, obj.line_distance, obj.blocks,
+                              obj.data, obj.width, obj.storage_size,
+                              obj.glyph_index, obj.glyph_width)))
+            else:
+                record = ("sheet", number,
+                          (self._persistent_id(obj.image), obj.rects))
+            self.objects[number] = obj
+            self.numbers[id(obj)] = number
+            self.new_resource(record)
+        return number
+
+    def new_resource(self, record: tuple):
+        pass
+
+class _DisplayListRecorder(_DisplayList):
+    """Records (and optionally defers) the drawing calls of every frame"""
+    def __init__(self, path: Optional[str], skip_identical: bool):
+        super().__init__()
+        self.path = path
+        self.file = None
+        if path:
+            self.file = open(path, "wb")
+            self.file.write(_DL_MAGIC)
+        self.skip_identical = skip_identical
+        self.funcs = {}
+        self.calls = []     # (opcode, args, kwargs) of the current frame
+        self.pending = []   # (call, state) not rasterized yet (when deferring)
+        self.flushed = False
+        self.previous = None
+        self.still = False  # Whether the previous frame left VRAM unchanged
+        self.start = vram.copy() if skip_identical else None
+        self.start_state = _draw_state()
+        self.frames = 0
+        self.skipped = 0
+        _hook_api(_DRAW_CALLS + ("dupdate", "dgetpixel", "_screenshot"),
+                  self.call)
+        _atexit.register(self.close)
+
+    def new_resource(self, record: tuple):
+        if self.file:
+            _pickle.dump(record, self.file, protocol=4)
+
+    def call(self, name: str, func, args: tuple, kwargs: dict):
+        op = _DRAW_OPCODES.get(name)
+        if op is None:
+            if name == "dupdate":
+                self.end_frame()
+            else:
+                self.flush()  # The VRAM is about to be read
+            return func(*args, **kwargs)
+        self.funcs[op] = func
+        if name in _SEQUENCE_CALLS:
+            args = tuple(map(_frozen, args))
+            kwargs = {key: _frozen(value) for key, value in kwargs.items()}
+        call = (op, args, kwargs)
+        self.calls.append(call)
+        if not self.skip_identical or name in _STATE_CALLS:
+            return func(*args, **kwargs)
+        self.pending.append((call, _draw_state()))
+
+    def flush(self):
+        """Rasterize the deferred calls"""
+        if not self.pending:
+            return
+        state = _draw_state()
+        for (op, args, kwargs), call_state in self.pending:
+            _set_draw_state(call_state)
+            self.funcs[op](*args, **kwargs)
+        _set_draw_state(state)
+        self.flushed = True
+        self.pending = []
+
+    def end_frame(self):
+        self.frames += 1
+        if self.file:
+            calls = [self.dump(*call) for call in self.calls]
+            _pickle.dump(("frame", calls), self.file, protocol=4)
+        if self.skip_identical:
+            if (self.still and not self.flushed and self.calls == self.previous):
+                self.pending = []
+                self.skipped += 1
+            else:
+                self.flush()
+                state = _draw_state()
+                self.still = (state == self.start_state
+                              and _np.array_equal(vram, self.start))
+                self.start[...] = vram
+                self.start_state = state
+        self.previous = self.calls
+        self.calls = []
+        self.flushed = False
+
+    def close(self):
+        if self.file and not self.file.closed:
+            self.file.close()
+            print(f"gint: recorded {self.frames} frames to {self.path}",
+                  file=sys.stderr)
+        if self.skip_identical:
+            print(f"gint: skipped {self.skipped} of {self.frames} identical frames",
+                  file=sys.stderr)
+
+def _read_display_list(path: str, display_list: Optional[_DisplayList] = None):
+    """Yield the frames of a recorded file as lists of pickled calls"""
+    display_list = display_list or _DisplayList()
+    with open(path, "rb") as f:
+        if f.read(len(_DL_MAGIC)) != _DL_MAGIC:
+            raise ValueError(f"{path} is not a gint display list")
+        while True:
+            try:
+                record = _pickle.load(f)
+            except EOFError:
+                return
+            if record[0] == "frame":
+                yield record[1]
+            else:
+                display_list.resource(record)
+
+def _frame_diff(previous: list, calls: list) -> list:
+    """Changes from one frame to the next as (tag, old calls, new calls), tag
+    being "replace", "delete" or "insert" and the calls still pickled"""
+    changes = []
+    matcher = _difflib.SequenceMatcher(None, previous, calls, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag != "equal":
+            changes.append((tag, previous[i1:i2], calls[j1:j2]))
+    return changes
+
+def _replay(path: str, diff: bool = False, skip_identical: bool = True) -> dict:
+    """Draw a recorded display list, frame by frame, without the program"""
+    display_list = _DisplayList()
+    funcs = [globals()[name] for name in _DRAW_CALLS]
+    previous = None
+    still = False
+    start = vram.copy()
+    frames = skipped = 0
+    raster_time = 0.0
+    for calls in _read_display_list(path, display_list):
+        if diff and previous is not None:
+            changes = _frame_diff(previous, calls)
+            if changes:
+                removed = sum(len(old) for _, old, _ in changes)
+                added = sum(len(new) for _, _, new in changes)
+                print(f"frame {frames}: -{removed} +{added} of {len(calls)} calls")
+        if skip_identical and still and calls == previous:
+            skipped += 1
+        else:
+            state = _draw_state()
+            start[...] = vram
+            t0 = time.perf_counter()
+            for data in calls:
+                op, args, kwargs = display_list.load(data)
+                funcs[op](*args, **kwargs)
+            raster_time += time.perf_counter() - t0
+            still = _draw_state() == state and _np.array_equal(vram, start)
+        previous = calls
+        frames += 1
+        dupdate()
+        if not _HEADLESS:
+            ev = pollevent()
+            if ev.type == KEYEV_DOWN and ev.key == KEY_EXIT:
+                break
+    return {'frames': frames, 'skipped': skipped, 'raster_time': raster_time}
+
+# Cost model. GINT_COST_MODEL=1 counts the bytecodes run by the program (with
+# sys.settrace) and its gint calls, weights them with costs of PythonExtra on
+# the calculator and reports the estimated time per frame and in total at
+# exit. The default costs are rough estimates for a 118 MHz SH4; measure yours
+# and give them in a JSON file with GINT_COST_MODEL=<file>:
+#
+#   {"bytecode_us": {"call": 9.0, "BINARY_OP": 1.4},
+#    "call_us": {"dtext": 30, "default": 5},
+#    "pixel_us": 0.02, "glyph_us": 12, "dupdate_ms": 20}
+#
+# bytecode_us is keyed by opcode class (see _opcode_class) or opcode name,
+# call_us by gint function. Drawing calls also pay per pixel and glyph drawn,
+# and dupdate() pays for the transfer to the display.
+
+import dis as _dis
+
+_COST_DEFAULTS = {
+    "bytecode_us": {
+        "stack": 0.3, "name": 1.2, "attr": 2.0, "arith": 1.5, "subscr": 1.8,
+        "call": 8.0, "return": 1.0, "build": 3.0, "iter": 1.5, "jump": 0.3,
+        "other": 1.0,
+    },
+    "call_us": {"default": 5.0},
+    "pixel_us": 0.02,
+    "glyph_us": 10.0,
+    "dupdate_ms": _DEVICE_UPDATE_MS,
+}
+
+def _opcode_class(name: str) -> str:
+    """Cost class of a CPython opcode"""
+    if name.startswith(("LOAD_FAST", "STORE_FAST", "LOAD_CONST", "LOAD_DEREF",
+                        "STORE_DEREF", "LOAD_CLOSURE", "POP_TOP", "PUSH_NULL",
+                        "COPY", "SWAP", "NOP", "RESUME", "CACHE", "PRECALL",
+                        "KW_NAMES")):
+        return "stack"
+    if name.startswith(("LOAD_GLOBAL", "LOAD_NAME", "STORE_GLOBAL",
+                        "STORE_NAME", "DELETE_")):
+        return "name"
+    if name.startswith(("LOAD_ATTR", "STORE_ATTR", "LOAD_METHOD")):
+        return "attr"
+    if name.startswith(("BINARY_SUBSCR", "STORE_SUBSCR", "BINARY_SLICE",
+                        "STORE_SLICE")):
+        return "subscr"
+    if name.startswith(("BINARY_", "UNARY_", "COMPARE_OP", "IS_OP",
+                        "CONTAINS_OP")):
+        return "arith"
+    if name.startswith("CALL"):
+        return "call"
+    if name.startswith("RETURN"):
+        return "return"
+    if name.startswith(("BUILD_", "LIST_", "SET_", "MAP_", "DICT_")):
+        return "build"
+    if name in ("FOR_ITER", "GET_ITER", "END_FOR"):
+        return "iter"
+    if "JUMP" in name:
+        return "jump"
+    return "other"
+
+class _CostModel:
+    """Estimates the run time of the program on the calculator"""
+    def __init__(self, calibration: Optional[str]):
+        costs = {key: dict(value) if isinstance(value, dict) else value
+                 for key, value in _COST_DEFAULTS.items()}
+        if calibration:
+            with open(calibration) as f:
+                for key, value in _json.load(f).items():
+                    if isinstance(value, dict):
+                        costs[key].update(value)
+                    else:
+                        costs[key] = value
+        self.costs = costs
+        table = costs["bytecode_us"]
+        self.weights = [table.get(name, table.get(_opcode_class(name), 0.0))
+                        for name in _dis.opname]
+        self.call_us = costs["call_us"]
+        self.counts = [0] * len(_dis.opname)
+        self.calls = dict.fromkeys(_GINT_CALLS, 0)
+        self.gint_us = 0.0       # Cost of gint calls so far
+        self.frame_start = 0.0   # Total cost when the frame started
+        self.frame_costs = []    # Estimated duration of each frame (us)
+        self.user_code = {}
+        _hook_api(_GINT_CALLS, self.call)
+        self.start_tracing()
+        _atexit.register(self.report)
+
+    def is_user_code(self, code) -> bool:
+        user = self.user_code.get(code)
+        if user is None:
+            user = self.user_code[code] = _is_user_file(code.co_filename)
+        return user
+
+    def start_tracing(self):
+        counts = self.counts
+        is_user_code = self.is_user_code
+
+        def trace_opcodes(frame, event, arg):
+            if event == "opcode":
+                counts[frame.f_code.co_code[frame.f_lasti]] += 1
+            return trace_opcodes
+
+        def trace_calls(frame, event, arg):
+            if is_user_code(frame.f_code):
+                frame.f_trace_opcodes = True
+                return trace_opcodes
+            return None
+
+        sys.settrace(trace_calls)
+        # The frames already running (the program importing gint) as well
+        frame = sys._getframe(1)
+        while frame is not None:
+            if is_user_code(frame.f_code):
+                frame.f_trace_opcodes = True
+                frame.f_trace = trace_opcodes
+            frame = frame.f_back
+
+    def bytecode_us(self) -> float:
+        return sum(c * w for c, w in zip(self.counts, self.weights) if c)
+
+    def total_us(self) -> float:
+        return self.bytecode_us() + self.gint_us
+
+    def call(self, name: str, func, args: tuple, kwargs: dict):
+        self.calls[name] += 1
+        pixels, glyphs = _pixels_drawn, _glyphs_drawn
+        cost = self.call_us.get(name, self.call_us["default"])
+        if name == "dupdate":
+            self.gint_us += cost + self.costs["dupdate_ms"] * 1000
+            total = self.total_us()
+            self.frame_costs.append(total - self.frame_start)
+            self.frame_start = total
+            return func(*args, **kwargs)
+        try:
+            return func(*args, **kwargs)
+        finally:
+            self.gint_us += (cost
+                             + (_pixels_drawn - pixels) * self.costs["pixel_us"]
+                             + (_glyphs_drawn - glyphs) * self.costs["glyph_us"])
+
+    def report(self):
+        sys.settrace(None)
+        total = self.total_us()
+        bytecodes = sum(self.counts)
+        print(f"gint: estimated {total / 1e6:.2f} s on the calculator, "
+              f"{len(self.frame_costs)} frames, {bytecodes} bytecodes",
+              file=sys.stderr)
+        if self.frame_costs:
+            ms = _np.array(self.frame_costs) / 1000
+            print(f"gint: frame ms: mean {ms.mean():.1f}  p95 "
+                  f"{_np.percentile(ms, 95):.1f}  max {ms.max():.1f}  "
+                  f"({1000 / ms.mean():.1f} fps)", file=sys.stderr)
+        classes = {}
+        for name, count, weight in zip(_dis.opname, self.counts, self.weights):
+            if count:
+                kind = _opcode_class(name)
+                classes[kind] = classes.get(kind, 0) + count * weight
+        top = sorted(classes.items(), key=lambda item: -item[1])
+        print("gint: python " + "  ".join(
+              f"{kind} {us / 1e6:.2f}s" for kind, us in top if us), file=sys.stderr)
+        calls = sorted(((count, name) for name, count in self.calls.items()
+                        if count), reverse=True)
+        print(f"gint: gint {self.gint_us / 1e6:.2f}s  " + "  ".join(
+              f"{name} {count}" for count, name in calls), file=sys.stderr)
+
+# Performance overlay, shown over the window with F12 (never in the VRAM,
+# so screenshots and dgetpixel() do not see it). It is available in a window
+# unless GINT_HUD=0, with the frame times measured by dupdate(). GINT_HUD=1
+# shows it from the start and also times the gint calls, which slows them;
+# the calls can only be hooked at import, so F12 alone does not do this.
+
+_INPUT_CALLS = ("pollevent", "getkey", "getkey_opt", "clearevents")
+
+class _Hud:
+    """Per-frame statistics of the program, drawn over the window"""
+    def __init__(self, visible: bool, hook: bool):
+        self.visible = visible
+        self.hooked = hook
+        self.font = None
+        self.area = None        # Window area covered, in VRAM pixels
+        self.calls = {}
+        self.gint_time = 0.0    # In gint calls, this frame
+        self.input_time = 0.0   # Waiting for input, this frame
+        self.update_time = 0.0  # In the previous dupdate()
+        self.frame_start = time.perf_counter()
+        self.frame_times = _deque(maxlen=30)
+        self.counters = (_pixels_drawn, _glyphs_drawn)
+        self.lines = []
+        if hook:
+            _hook_api(_GINT_CALLS, self.call)
+
+    def toggle(self):
+        self.visible = not self.visible
+        if not self.visible and self.area:
+            pygame.display.update(_blit_frame(*self.area))  # Erase the overlay
+            self.area = None
+
+    def call(self, name: str, func, args: tuple, kwargs: dict):
+        if name == "dupdate":  # Timed by dupdate() itself
+            return func(*args, **kwargs)
+        self.calls[name] = self.calls.get(name, 0) + 1
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if name in _INPUT_CALLS:
+                self.input_time += elapsed
+            else:
+                self.gint_time += elapsed
+
+    def end_frame(self):
+        """Called by dupdate() before presenting the frame"""
+        now = time.perf_counter()
+        frame = now - self.frame_start
+        self.frame_start = now
+        self.frame_times.append(frame)
+        counters = (_pixels_drawn, _glyphs_drawn)
+        pixels, glyphs = (a - b for a, b in zip(counters, self.counters))
+        self.counters = counters
+
+        ms = 1000
+        user = frame - self.gint_time - self.input_time - self.update_time
+        fps = len(self.frame_times) / sum(self.frame_times)
+        if self.hooked:
+            calls = sorted(self.calls.items(), key=lambda item: -item[1])
+            calls = [f"{name} {count}" for name, count in calls]
+            times = (f"python {user * ms:.1f}  gint {self.gint_time * ms:.1f}  "
+                     f"input {self.input_time * ms:.1f}  ")
+        else:
+            calls = ["GINT_HUD=1 to time gint calls"]
+            times = f"program {user * ms:.1f}  "
+        self.lines = [
+            f"{fps:5.1f} fps  frame {frame * ms:5.1f} ms",
+            f"{times}update {self.update_time * ms:.1f} ms",
+            f"pixels {pixels}  glyphs {glyphs}",
+        ] + ["  ".join(calls[i:i+4]) for i in range(0, len(calls), 4)]
+        self.calls = {}
+        self.gint_time = self.input_time = 0.0
+
+    def draw(self) -> list:
+        """Draw the overlay on the window, returns the areas to update"""
+        if self.font is None:
+            pygame.font.init()
+            self.font = pygame.font.Font(None, max(round(14 * SCALE), 1))
+        texts = [self.font.render(line, True, (255, 255, 255))
+                 for line in self.lines or ["waiting for dupdate()"]]
+        pad = round(2 * SCALE)
+        width = max(text.get_width() for text in texts) + 2 * pad
+        height = sum(text.get_height() for text in texts) + 2 * pad
+        width = min(int(-(-width // SCALE)), DWIDTH)
+        height = min(int(-(-height // SCALE)), DHEIGHT)
+
+        # Put back the frame where the previous overlay was larger
+        updated = []
+        if self.area:
+            updated.append(_blit_frame(*self.area))
+        self.area = (0, 0, width, height)
+        area = _scaled_rect(0, 0, width, height).move(_view.topleft)
+        screen.fill((0, 0, 0), area)
+        y = area.y + pad
+        for text in texts:
+            screen.blit(text, (area.x + pad, y))
+            y += text.get_height()
+        return updated + [area]
+
+# Timeline. GINT_TRACE=<file.json> writes a Chrome trace (open it in Perfetto
+# or chrome://tracing): one slice per frame, ending with its dupdate(), with
+# the gint calls nested inside and input waits in their own category. Events
+# are written as they happen, so long captures do not use more memory.
+
+class _Tracer:
+    """Streams frames and gint calls to a Chrome trace file"""
+    def __init__(self, path: str):
+        self.path = path
+        self.file = open(path, "w")
+        self.file.write('[{"name":"process_name","ph":"M","pid":1,"tid":1,'
+                        '"args":{"name":"gint"}},\n')
+        self.origin = time.perf_counter()
+        self.frame = 0
+        self.begin_frame(self.origin)
+        _hook_api(_GINT_CALLS, self.call)
+        _atexit.register(self.close)
+
+    def us(self, t: float) -> float:
+        return (t - self.origin) * 1e6
+
+    def begin_frame(self, t: float):
+        self.file.write(f'{{"name":"frame {self.frame}","cat":"frame","ph":"B",'
+                        f'"ts":{self.us(t):.1f},"pid":1,"tid":1}},\n')
+
+    def call(self, name: str, func, args: tuple, kwargs: dict):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            end = time.perf_counter()
+            cat = "input" if name in _INPUT_CALLS else "gint"
+            self.file.write(f'{{"name":"{name}","cat":"{cat}","ph":"X",'
+                            f'"ts":{self.us(start):.1f},'
+                            f'"dur":{(end - start) * 1e6:.1f},"pid":1,"tid":1}},\n')
+            if name == "dupdate":
+                self.file.write(f'{{"name":"frame {self.frame}","cat":"frame",'
+                                f'"ph":"E","ts":{self.us(end):.1f},'
+                                f'"pid":1,"tid":1}},\n')
+                self.frame += 1
+                self.begin_frame(end)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(f'{{"name":"frame {self.frame}","cat":"frame","ph":"E",'
+                        f'"ts":{self.us(time.perf_counter()):.1f},'
+                        f'"pid":1,"tid":1}}]\n')
+        self.file.close()
+        print(f"gint: traced {self.frame} frames to {self.path}", file=sys.stderr)
+
+# Heap budget. GINT_HEAP=<size> (in bytes, or with a k or M suffix) emulates
+# the PythonExtra heap. gc.mem_alloc() and gc.mem_free() estimate what the
+# program's live objects would take there: the objects reachable from its
+# modules and running functions are sized as MicroPython lays them out on the
+# calculator (32-bit, 16-byte heap blocks), where small ints, None and
+# booleans are stored in place and lists hold 4-byte slots. MemoryError is
+# raised when the estimate exceeds the heap; this is checked by these
+# functions, by gc.collect() and at every dupdate(). CPython's objects are
+# larger, so the objects are only walked once tracemalloc reports more memory
+# than the heap. Code is not counted, and strings the calculator would intern
+# are counted like the ones built at run time.
+
+import tracemalloc as _tracemalloc
+
+def _parse_size(text: str) -> int:
+    text = text.strip().lower()
+    scale = {"k": 1024, "m": 1024 * 1024}.get(text[-1:], 1)
+    return int(float(text.rstrip("km")) * scale)
+
+_HEAP_BLOCK = 16
+
+def _heap_blocks(size: int) -> int:
+    """Bytes taken by an allocation of `size` bytes in the MicroPython heap"""
+    return -(-size // _HEAP_BLOCK) * _HEAP_BLOCK
+
+def _heap_table(count: int, slot: int) -> int:
+    """Object and hash table of a dict or set (tables are kept 2/3 full)"""
+    return _HEAP_BLOCK + _heap_blocks(count * 3 // 2 * slot)
+
+def _is_user_class(cls) -> bool:
+    module = sys.modules.get(cls.__module__)
+    return _is_user_file(getattr(module, "__file__", None) or "<frozen>")
+
+def _micropython_size(obj) -> tuple:
+    """Estimated (size, referenced objects) of an object in MicroPython"""
+    t = type(obj)
+    if obj is None or t is bool:
+        return 0, ()
+    if t is int:
+        if -2**30 <= obj < 2**30:
+            return 0, ()  # Small ints are stored in the slot
+        digits = -(-obj.bit_length() // 16)
+        return _HEAP_BLOCK + _heap_blocks(2 * digits), ()
+    if t is float:
+        return _HEAP_BLOCK, ()
+    if t is str:
+        size = len(obj) if obj.isascii() else len(obj.encode())
+        return _HEAP_BLOCK + _heap_blocks(size + 1), ()
+    if t is bytes:
+        return _HEAP_BLOCK + _heap_blocks(len(obj) + 1), ()
+    if t is bytearray:
+        return _HEAP_BLOCK + _heap_blocks(len(obj)), ()
+    if t is tuple:
+        return _heap_blocks(8 + 4 * len(obj)), obj
+    if t is list:
+        return _HEAP_BLOCK + _heap_blocks(4 * len(obj)), obj
+    if t is dict:
+        return _heap_table(len(obj), 8), (*obj.keys(), *obj.values())
+    if t is set or t is frozenset:
+        return _heap_table(len(obj), 4), obj
+    if t is type:
+        if not _is_user_class(obj):
+            return 0, ()
+        attrs = [v for k, v in vars(obj).items() if not k.startswith("__")]
+        return _heap_table(len(attrs), 8), attrs
+    if isinstance(obj, (_types.ModuleType, _types.FunctionType,
+                        _types.BuiltinFunctionType, _types.MethodType,
+                        _types.CodeType)):
+        return 0, ()  # Modules are walked from sys.modules
+    attrs = getattr(obj, "__dict__", None)
+    if type(attrs) is dict:
+        # Attribute names are interned, only the values are counted
+        return _heap_table(len(attrs), 8), attrs.values()
+    return _HEAP_BLOCK, ()
+
+class _HeapBudget:
+    """Accounts the program's live objects against a MicroPython heap size"""
+    def __init__(self, size: int):
+        self.size = size
+        self.collect = gc.collect
+        _tracemalloc.start()
+        gc.mem_alloc = self.mem_alloc
+        gc.mem_free = self.mem_free
+        gc.collect = self.gc_collect
+        _hook_api(("dupdate",), self.call)
+
+    def used(self) -> int:
+        """Estimated size of the program's live objects in MicroPython"""
+        roots = []
+        total = 0
+        for module in list(sys.modules.values()):
+            if _is_user_file(getattr(module, "__file__", None) or "<frozen>"):
+                # Global names are interned, only the values are counted
+                total += _heap_table(len(module.__dict__), 8)
+                roots.extend(module.__dict__.values())
+        frame = sys._getframe(1)
+        while frame is not None:
+            if frame.f_locals is not frame.f_globals \
+               and _is_user_file(frame.f_code.co_filename):
+                roots.extend(frame.f_locals.values())
+            frame = frame.f_back
+        seen = set()
+        while roots:
+            obj = roots.pop()
+            if id(obj) in seen:
+                continue
+            seen.add(id(obj))
+            size, refs = _micropython_size(obj)
+            total += size
+            roots.extend(refs)
+        return total
+
+    def check(self) -> int:
+        # CPython needs more than MicroPython, only look closer when near
+        if _tracemalloc.get_traced_memory()[0] <= self.size:
+            return -1
+        used = self.used()
+        if used > self.size:
+            raise MemoryError(f"memory allocation failed, heap of {self.size}"
+                              f" bytes exhausted ({used} bytes in use)")
+        return used
+
+    def mem_alloc(self) -> int:
+        used = self.check()
+        return self.used() if used < 0 else used
+
+    def mem_free(self) -> int:
+        return max(self.size - self.mem_alloc(), 0)
+
+    def gc_collect(self, *args):
+        result = self.collect(*args)
+        self.check()
+        return result
+
+    def call(self, name: str, func, args: tuple, kwargs: dict):
+        self.check()
+        return func(*args, **kwargs)
+
+# Allocations per frame. With GINT_ALLOC_REPORT=1, the memory allocated by
+# each line of the program is measured with tracemalloc and summed per frame,
+# to find what would fill the calculator's heap and trigger GC pauses. CPython
+# frees temporaries right away, so each line counts the peak it reached, not
+# what is left at dupdate(). Allocations inside gint calls are not counted,
+# except for the objects they return (like pollevent()'s events). At exit,
+# the lines that allocate the most are printed along with the first frames
+# above GINT_ALLOC_THRESHOLD (1k by default). Sizes are CPython's, and small
+# objects that CPython recycles (tuples, floats...) are missed, so this is a
+# lower bound.
+
+class _AllocTracker:
+    """Measures the memory allocated by each line of the program per frame"""
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self.user_code = {}
+        self.code = None         # Line being measured
+        self.lineno = 0
+        self.start = 0           # Traced memory when the line started
+        self.pending = 0         # Measured before gint calls in the line
+        self.frame_lines = {}    # (path, lineno) -> bytes, this frame
+        self.frame_bytes = 0
+        self.frame_start = time.perf_counter()
+        self.frames = []         # Bytes allocated by each frame
+        self.duration = 0.0
+        self.lines = {}          # (path, lineno) -> [bytes, frames]
+        self.flagged = []        # (frame, bytes, top lines)
+        self.noise = 0
+        if not _tracemalloc.is_tracing():
+            _tracemalloc.start()
+        _hook_api(_GINT_CALLS, self.call)
+        _atexit.register(self.report)
+        self.start_tracing()
+        # What measuring a line costs, from lines that allocate nothing
+        namespace = {}
+        exec(compile("def f():\n a = 0\n a = 1\n a = 2\n", "<calibration>",
+                     "exec"), namespace)
+        namespace["f"]()
+        self.noise = min(self.frame_lines.values(), default=0)
+        self.frame_lines = {}
+        self.frame_bytes = 0
+        self.pending = 0
+
+    def is_user_code(self, code) -> bool:
+        user = self.user_code.get(code)
+        if user is None:
+            user = self.user_code[code] = _is_user_file(code.co_filename)
+        return user
+
+    def restart(self):
+        _tracemalloc.reset_peak()
+        self.start = _tracemalloc.get_traced_memory()[0]
+
+    def measure(self) -> int:
+        current, peak = _tracemalloc.get_traced_memory()
+        return peak - self.start - self.noise
+
+    def end_line(self):
+        size = self.pending + max(self.measure(), 0)
+        self.pending = 0
+        if size > 0 and self.code is not None:
+            key = (self.code.co_filename, self.lineno)
+            self.frame_lines[key] = self.frame_lines.get(key, 0) + size
+            self.frame_bytes += size
+
+    def start_tracing(self):
+        is_user_code = self.is_user_code
+
+        def trace_lines(frame, event, arg):
+            if event == "line":
+                self.end_line()
+                self.code, self.lineno = frame.f_code, frame.f_lineno
+                self.restart()
+            elif event == "return":
+                self.end_line()
+                # Back to the rest of the caller's line
+                back = frame.f_back
+                if back is not None and is_user_code(back.f_code):
+                    self.code, self.lineno = back.f_code, back.f_lineno
+                else:
+                    self.code = None
+                self.restart()
+            return trace_lines
+
+        def trace_calls(frame, event, arg):
+            # The frame object exists only because of tracing
+            self.pending -= sys.getsizeof(frame)
+            return trace_lines if is_user_code(frame.f_code) else None
+
+        self.tracer = trace_calls
+        sys.settrace(trace_calls)
+        frame = sys._getframe(1)
+        while frame is not None:
+            if is_user_code(frame.f_code):
+                frame.f_trace = trace_lines
+            frame = frame.f_back
+
+    def call(self, name: str, func, args: tuple, kwargs: dict):
+        # Frames get allocated when traced, so not within gint
+        sys.settrace(None)
+        # The arguments were packed by the hook, they are not the program's
+        self.pending += self.measure() - sys.getsizeof(args) \
+            - sys.getsizeof(kwargs)
+        if name == "dupdate":
+            self.restart()
+            self.end_line()
+            self.end_frame()
+        before = _tracemalloc.get_traced_memory()[0]
+        result = None
+        try:
+            result = func(*args, **kwargs)
+            return result
+        finally:
+            # What the simulator keeps for itself is not the program's
+            if result is not None:
+                self.pending += max(_tracemalloc.get_traced_memory()[0]
+                                    - before, 0)
+            self.restart()
+            sys.settrace(self.tracer)
+
+    def end_frame(self):
+        """Called by dupdate() before presenting the frame"""
+        now = time.perf_counter()
+        self.duration += now - self.frame_start
+        self.frame_start = now
+        self.frames.append(self.frame_bytes)
+        for key, size in self.frame_lines.items():
+            stats = self.lines.setdefault(key, [0, 0])
+            stats[0] += size
+            stats[1] += 1
+        if self.frame_bytes > self.threshold and len(self.flagged) < 10:
+            top = sorted(self.frame_lines.items(), key=lambda item: -item[1])
+            self.flagged.append((len(self.frames), self.frame_bytes, top[:3]))
+        self.frame_lines = {}
+        self.frame_bytes = 0
+
+    @staticmethod
+    def where(key: tuple) -> str:
+        path, lineno = key
+        return f"{os.path.basename(path)}:{lineno}"
+
+    def report(self):
+        sys.settrace(None)
+        if not self.frames:
+            return
+        frames = _np.array(self.frames)
+        over = int(_np.count_nonzero(frames > self.threshold))
+        rate = frames.sum() / self.duration / 1024 if self.duration else 0
+        print(f"gint: allocated per frame: mean {frames.mean():.0f} B  "
+              f"max {frames.max()} B  ({rate:.1f} kB/s), "
+              f"{over}/{len(frames)} frames over {self.threshold} B",
+              file=sys.stderr)
+        top = sorted(self.lines.items(), key=lambda item: -item[1][0])[:5]
+        for key, (size, count) in top:
+            print(f"gint:   {self.where(key)}  {size / len(frames):.0f} B/frame"
+                  f"  in {count} frames", file=sys.stderr)
+        for frame, size, lines in self.flagged:
+            print(f"gint: frame {frame}: {size} B  " + "  ".join(
+                  f"{self.where(key)} {n} B" for key, n in lines),
+                  file=sys.stderr)
+
+# const() folding. With GINT_CONST_FOLD=1, the modules imported by the
+# program are compiled like MicroPython does: "NAME = const(expr)" at module
+# level is evaluated at compile time, later uses of NAME in the module are
+# replaced by its value, and arithmetic on integer constants is folded. Like
+# on the calculator, constants named with a leading underscore are not stored
+# in the module at all. Each module's folded names are printed on import.
+
+import ast as _ast
+import importlib.machinery as _machinery
+
+_CONST_OPS = {_ast.Add: lambda a, b: a + b,
+              _ast.Sub: lambda a, b: a - b,
+              _ast.Mult: lambda a, b: a * b,
+              _ast.FloorDiv: lambda a, b: a // b,
+              _ast.Mod: lambda a, b: a % b,
+              _ast.Pow: lambda a, b: a ** b,
+              _ast.LShift: lambda a, b: a << b,
+              _ast.RShift: lambda a, b: a >> b,
+              _ast.BitOr: lambda a, b: a | b,
+              _ast.BitAnd: lambda a, b: a & b,
+              _ast.BitXor: lambda a, b: a ^ b}
+_CONST_UNARY = {_ast.USub: lambda a: -a, _ast.UAdd: lambda a: a,
+                _ast.Invert: lambda a: ~a}
+
+def _small_int(node) -> bool:
+    # Folded values must fit in a MicroPython small int (31 bits)
+    return (isinstance(node, _ast.Constant) and type(node.value) is int
+            and -2**30 <= node.value < 2**30)
+
+class _ConstFolder(_ast.NodeTransformer):
+    """Inlines the const() names of a module and folds integer arithmetic"""
+    def __init__(self):
+        self.consts = {}
+        self.folded = []
+
+    @staticmethod
+    def is_const_call(node) -> bool:
+        if not isinstance(node, _ast.Call) or len(node.args) != 1 \
+           or node.keywords:
+            return False
+        func = node.func
+        return (isinstance(func, _ast.Name) and func.id == "const") or \
+               (isinstance(func, _ast.Attribute) and func.attr == "const"
+                and isinstance(func.value, _ast.Name)
+                and func.value.id == "micropython")
+
+    def visit_Module(self, node):
+        body = []
+        for stmt in node.body:
+            stmt = self.visit(stmt)
+            if isinstance(stmt, _ast.Assign) and len(stmt.targets) == 1 \
+               and isinstance(stmt.targets[0], _ast.Name) \
+               and self.is_const_call(stmt.value) \
+               and _small_int(stmt.value.args[0]):
+                name = stmt.targets[0].id
+                value = stmt.value.args[0]
+                self.consts[name] = value.value
+                self.folded.append(name)
+                if name.startswith("_"):
+                    continue
+                stmt.value = value
+            body.append(stmt)
+        node.body = body
+        return node
+
+    def visit_FunctionDef(self, node):
+        # Names assigned in the function are its own locals
+        local = {n.id for n in _ast.walk(node)
+                 if isinstance(n, _ast.Name) and isinstance(n.ctx, _ast.Store)}
+        local.update(a.arg for a in _ast.walk(node.args)
+                     if isinstance(a, _ast.arg))
+        saved = self.consts
+        self.consts = {k: v for k, v in saved.items() if k not in local}
+        self.generic_visit(node)
+        self.consts = saved
+        return node
+
+    visit_AsyncFunctionDef = visit_Lambda = visit_FunctionDef
+
+    def visit_Name(self, node):
+        if isinstance(node.ctx, _ast.Load) and node.id in self.consts:
+            constant = _ast.Constant(self.consts[node.id])
+            return _ast.copy_location(constant, node)
+        return node
+
+    def visit_BinOp(self, node):
+        self.generic_visit(node)
+        op = _CONST_OPS.get(type(node.op))
+        if op is None or not (_small_int(node.left) and _small_int(node.right)):
+            return node
+        a, b = node.left.value, node.right.value
+        if (b == 0 and isinstance(node.op, (_ast.FloorDiv, _ast.Mod))) or \
+           (b < 0 and isinstance(node.op,
+                                 (_ast.Pow, _ast.LShift, _ast.RShift))) or \
+           (isinstance(node.op, _ast.LShift) and b >= 31) or \
+           (isinstance(node.op, _ast.Pow) and b >= 31):
+            return node
+        result = _ast.copy_location(_ast.Constant(op(a, b)), node)
+        return result if _small_int(result) else node
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        op = _CONST_UNARY.get(type(node.op))
+        if op is None or not _small_int(node.operand):
+            return node
+        result = _ast.Constant(op(node.operand.value))
+        result = _ast.copy_location(result, node)
+        return result if _small_int(result) else node
+
+def _fold_consts(source, path: str):
+    """Compile source with const() folding, returns (code, folded names)"""
+    tree = _ast.parse(source, path)
+    folder = _ConstFolder()
+    tree = _ast.fix_missing_locations(folder.visit(tree))
+    return compile(tree, path, "exec", dont_inherit=True), folder.folded
+
+class _ConstFoldingLoader(_machinery.SourceFileLoader):
+    def get_code(self, fullname):
+        # Not from or to __pycache__, which has the unfolded bytecode
+        path = self.get_filename(fullname)
+        code, folded = _fold_consts(self.get_data(path), path)
+        if folded:
+            print(f"gint: {fullname}: folded {', '.join(folded)}",
+                  file=sys.stderr)
+        return code
+
+class _ConstFoldingFinder:
+    """Loads the program's modules with _ConstFoldingLoader"""
+    @staticmethod
+    def find_spec(fullname, path=None, target=None):
+        spec = _machinery.PathFinder.find_spec(fullname, path)
+        if spec is None or not isinstance(spec.loader,
+                                          _machinery.SourceFileLoader) \
+           or not _is_user_file(spec.origin):
+            return None
+        spec.loader = _ConstFoldingLoader(fullname, spec.origin)
+        return spec
+
+# Input recording. GINT_INPUT_RECORD=<file> saves the events delivered to the
+# program and GINT_INPUT_REPLAY=<file> feeds them back instead of the keyboard
+# and mouse, with or without a window. Each event is stamped with the frame
+# number and the index of the input call (pollevent(), getkey_opt() or
+# clearevents()) in that frame, so a program that only depends on its input
+# gets every event at the same point; getkey_opt() timeouts are recorded too.
+# random is seeded from the file, and the replay stops when the program goes
+# past the frame where the recording ended (at its first input call or
+# dupdate() after that frame), so the last frame still gets its events. Records are packed with _INPUT_EVENT after a header.
+
+import random as _random
+import struct
+
+_INPUT_MAGIC = b"GINTIN1\n"
+_INPUT_SEED = struct.Struct("<Q")
+# Frame, call, event type, key (255 for none), x, y, shift | alpha << 1
+_INPUT_EVENT = struct.Struct("<IIBBhhB")
+_INPUT_END = 255  # Type of the last record, which gives the final frame
+
+class _InputLog:
+    """Numbers the input calls of the program within each frame"""
+    end = None
+
+    def __init__(self):
+        self.frame = -1
+        self.call = 0
+
+    def next_call(self):
+        if self.frame != _frame_count:
+            self.frame = _frame_count
+            self.call = 0
+        else:
+            self.call += 1
+
+    def check_end(self):
+        """Stop the program once it goes past the end of the recording"""
+        if self.end is not None and _frame_count > self.end:
+            raise SystemExit(0)
+
+class _InputRecorder(_InputLog):
+    """Writes the events delivered to the program to a file"""
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        self.count = 0
+        seed = int.from_bytes(os.urandom(_INPUT_SEED.size), "little")
+        _random.seed(seed)
+        self.file = open(path, "wb")
+        self.file.write(_INPUT_MAGIC + _INPUT_SEED.pack(seed))
+        _atexit.register(self.close)
+
+    def write(self, ev: KeyEvent):
+        self.file.write(_INPUT_EVENT.pack(
+            self.frame, self.call, ev.type, 255 if ev.key is None else ev.key,
+            ev.x, ev.y, ev.shift | ev.alpha << 1))
+        self.count += 1
+
+    def pollevent(self) -> KeyEvent:
+        self.next_call()
+        ev = _poll()
+        if ev.type != KEYEV_NONE:
+            self.write(ev)
+        return ev
+
+    def getkey_opt(self, timeout_ms: Optional[int]) -> KeyEvent:
+        self.next_call()
+        ev = _wait_key(timeout_ms)
+        self.write(ev)
+        return ev
+
+    def clearevents(self):
+        self.next_call()
+        _drain(self)
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.file.write(_INPUT_EVENT.pack(_frame_count, 0, _INPUT_END,
+                                          255, 0, 0, 0))
+        self.file.close()
+        print(f"gint: recorded {self.count} input events over "
+              f"{_frame_count} frames to {self.path}", file=sys.stderr)
+
+class _InputReplayer(_InputLog):
+    """Delivers the events of a recording in place of pygame's"""
+    def __init__(self, path: str):
+        super().__init__()
+        self.path = path
+        with open(path, "rb") as file:
+            data = file.read()
+        if not data.startswith(_INPUT_MAGIC):
+            raise ValueError(f"{path}: not an input recording")
+        _random.seed(_INPUT_SEED.unpack_from(data, len(_INPUT_MAGIC))[0])
+        data = data[len(_INPUT_MAGIC) + _INPUT_SEED.size:]
+        # A recording that was killed may end in the middle of a record
+        data = data[:len(data) - len(data) % _INPUT_EVENT.size]
+        self.records = list(_INPUT_EVENT.iter_unpack(data))
+        if self.records and self.records[-1][2] == _INPUT_END:
+            self.end = self.records.pop()[0]
+        self.index = 0
+        self.late = 0  # Events due at an earlier call: the program diverged
+        _atexit.register(self.close)
+
+    def next_call(self):
+        self.check_end()
+        super().next_call()
+        if screen is not None:
+            pygame.event.pump()  # Keep the window responsive
+
+    def next(self) -> Optional[KeyEvent]:
+        """Next event due at the current call, or None"""
+        if self.index == len(self.records):
+            return None
+        frame, call, ev_type, key, x, y, mods = self.records[self.index]
+        if frame > self.frame or frame == self.frame and call > self.call:
+            return None
+        if frame < self.frame or call < self.call:
+            self.late += 1
+        self.index += 1
+        if ev_type == KEYEV_NONE:
+            return _NONE_EVENT
+        ev = KeyEvent(ev_type, None if key == 255 else key, (x, y))
+        ev.shift = bool(mods & 1)
+        ev.alpha = bool(mods & 2)
+        return _deliver(ev)
+
+    def pollevent(self) -> KeyEvent:
+        self.next_call()
+        ev = self.next()
+        return _NONE_EVENT if ev is None else ev
+
+    def getkey_opt(self, timeout_ms: Optional[int]) -> KeyEvent:
+        self.next_call()
+        ev = self.next()
+        if ev is None:
+            # The recording is over: nobody will press a key
+            if timeout_ms is None:
+                sys.exit()
+            return _NONE_EVENT
+        return ev
+
+    def clearevents(self):
+        self.next_call()
+        while self.next() is not None:
+            pass
+
+    def close(self):
+        if self.records is None:
+            return
+        late = f", {self.late} late" if self.late else ""
+        print(f"gint: replayed {self.index} of {len(self.records)} input "
+              f"events from {self.path}{late}", file=sys.stderr)
+        self.records = None
+
+# Input latency. GINT_LATENCY_REPORT=1 measures, for each key press and touch,
+# the time from the moment gint read it from pygame (or from a replayed
+# recording) to the end of the first dupdate() that shows a frame different
+# from the previous one, and prints percentiles at exit. Releases are not
+# measured, as programs rarely redraw for them. GINT_LATENCY_REPORT=<file>
+# also appends the results to a file, one JSON object per run, to follow them
+# across changes. Event times are in milliseconds, so values are rounded up
+# by less than 1 ms.
+
+_LATENCY_EVENTS = (KEYEV_DOWN, KEYEV_TOUCH_DOWN, KEYEV_TOUCH_DRAG)
+
+class _LatencyMeter:
+    """Times input events until the frame that responds to them"""
+    def __init__(self, path: Optional[str]):
+        self.path = path
+        self.pending = []     # Times of the events waiting for a new frame
+        self.latencies = []   # Milliseconds
+        self.previous = vram.copy()
+        _atexit.register(self.close)
+
+    def input(self, ev: KeyEvent):
+        if ev.type in _LATENCY_EVENTS:
+            self.pending.append(ev.time)
+
+    def frame(self):
+        """Called by dupdate() once the frame is shown"""
+        if self.pending and not _np.array_equal(vram, self.previous):
+            now = time.monotonic() * 1000
+            self.latencies += [now - t for t in self.pending]
+            self.pending.clear()
+        _np.copyto(self.previous, vram)
+
+    def report(self) -> dict:
+        report = {'program': os.path.basename(sys.argv[0]),
+                  'events': len(self.latencies),
+                  'unanswered': len(self.pending)}
+        if self.latencies:
+            ms = _np.array(self.latencies)
+            report.update(p50_ms=_np.percentile(ms, 50),
+                          p90_ms=_np.percentile(ms, 90),
+                          p99_ms=_np.percentile(ms, 99), max_ms=ms.max())
+        return report
+
+    def close(self):
+        report = self.report()
+        if self.path:
+            with open(self.path, "a") as file:
+                file.write(_json.dumps(report) + "\n")
+        if report['events']:
+            print("gint: input latency of {program} over {events} inputs, ms: "
+                  "p50 {p50_ms:.1f}  p90 {p90_ms:.1f}  p99 {p99_ms:.1f}  "
+                  "max {max_ms:.1f}".format(**report), file=sys.stderr)
+        if report['unanswered']:
+            print(f"gint: {report['unanswered']} inputs were not followed by "
+                  f"a new frame", file=sys.stderr)
+
+_display_list = None
+_cost_model = None
+_hud = None
+_tracer = None
+_heap = None
+_allocs = None
+_input_log = None
+_latency = None
+
+def _install_tools():
+    """Enable the tools selected by the GINT_* environment variables"""
+    global _display_list, _cost_model, _hud, _tracer, _heap, _allocs
+    global _input_log, _latency, _frame_intervals
+    if os.environ.get("GINT_CONST_FOLD", "0") not in ("", "0"):
+        sys.meta_path.insert(0, _ConstFoldingFinder())
+    replay = os.environ.get("GINT_INPUT_REPLAY", "")
+    record = os.environ.get("GINT_INPUT_RECORD", "")
+    if replay:
+        _input_log = _InputReplayer(replay)
+    elif record:
+        _input_log = _InputRecorder(record)
+    latency = os.environ.get("GINT_LATENCY_REPORT", "0")
+    if latency not in ("", "0"):
+        _latency = _LatencyMeter(None if latency == "1" else latency)
+    pacing = os.environ.get("GINT_PACING", "")
+    if pacing:
+        _set_pacing(pacing.lower())
+    if os.environ.get("GINT_FRAME_REPORT", "0") not in ("", "0"):
+        _frame_intervals = []
+        _atexit.register(_print_frame_report)
+    record = os.environ.get("GINT_RECORD", "")
+    skip = os.environ.get("GINT_SKIP_IDENTICAL", "0") not in ("", "0")
+    if record or skip:
+        _display_list = _DisplayListRecorder(record or None, skip)
+    cost_model = os.environ.get("GINT_COST_MODEL", "0")
+    if cost_model not in ("", "0"):
+        _cost_model = _CostModel(None if cost_model == "1" else cost_model)
+    heap = os.environ.get("GINT_HEAP", "")
+    if heap:
+        _heap = _HeapBudget(_parse_size(heap))
+    trace = os.environ.get("GINT_TRACE", "")
+    if trace:
+        _tracer = _Tracer(trace)
+    hud = os.environ.get("GINT_HUD", "")
+    if not _HEADLESS and hud != "0":
+        _hud = _Hud(visible=hud == "1", hook=hud == "1")
+    # Last, so that the other tools' allocations are in the gint calls
+    if os.environ.get("GINT_ALLOC_REPORT", "0") not in ("", "0"):
+        if _cost_model is not None:
+            print("gint: GINT_ALLOC_REPORT cannot be used with "
+                  "GINT_COST_MODEL", file=sys.stderr)
+        else:
+            _allocs = _AllocTracker(_parse_size(
+                os.environ.get("GINT_ALLOC_THRESHOLD", "1k")))
+
+# Launcher. "python gint.py run program.py" runs the program in this process
+# and runs it again, in a fresh namespace, whenever it or one of its modules
+# changes; the window, the text cache and the decoded images and fonts whose
+# data did not change are kept. gint checks for changes in dupdate() and
+# pollevent(). When the program ends, the launcher waits for the next change.
+
+import types as _types
+import builtins as _builtins
+
+class _Reload(BaseException):
+    """Raised in the program by gint when its files changed"""
+
+# Decoded images and fonts by content, kept between runs by the launcher.
+# Entries not used by a run are dropped at the end of the next one.
+_resident = None
+_resident_previous = {}
+
+def _resident_get(key: str):
+    value = _resident.get(key)
+    if value is None:
+        value = _resident_previous.pop(key, None)
+        if value is not None:
+            _resident[key] = value
+    return value
+
+def _reset_simulator():
+    """Back to the state of a program that just imported gint"""
+    global _current_font, _frame_count, _last_present, _key_states, _modifiers
+    dwindow_set(0, 0, DWIDTH, DHEIGHT)
+    _current_font = _default_font
+    _key_states = {}
+    _modifiers = {'shift': False, 'alpha': False}
+    _events.clear()
+    for keys in (_keys_down, _keys_pressed, _keys_released):
+        keys[:] = _NO_KEYS
+    _np_rect(0, 0, DWIDTH - 1, DHEIGHT - 1, C_WHITE)
+    if screen is None:
+        _dirty.clear()
+    else:
+        pygame.event.clear()
+        _present()
+        pygame.display.set_caption("ClassPad")
+    _frame_count = 0
+    _last_present = None
+
+class _Launcher:
+    """Runs a program, and runs it again whenever its files change"""
+    def __init__(self, path: str, argv: list, watch: bool):
+        self.path = os.path.abspath(path)
+        self.argv = argv
+        self.watch = watch
+        self.mtimes = {}
+        self.next_check = 0.0
+
+    def files(self):
+        yield self.path
+        for module in list(sys.modules.values()):
+            path = getattr(module, "__file__", None)
+            if path and _is_user_file(path):
+                yield path
+
+    def changed(self) -> bool:
+        """Whether a file changed since the run started (or since first seen)"""
+        changed = False
+        for path in [*self.mtimes, *self.files()]:
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except OSError:
+                continue
+            changed |= self.mtimes.setdefault(path, mtime) != mtime
+        return changed
+
+    def check(self):
+        now = time.perf_counter()
+        if self.watch and now >= self.next_check:
+            self.next_check = now + 0.25
+            if self.changed():
+                raise _Reload()
+
+    def run_program(self):
+        """Run the program once, returns its exit status or None if reloaded"""
+        global _resident, _resident_previous
+        _reset_simulator()
+        _resident_previous, _resident = _resident or {}, {}
+        self.mtimes = {}
+        self.changed()
+        modules = set(sys.modules)
+        module = _types.ModuleType("__main__")
+        module.__file__ = self.path
+        module.__builtins__ = _builtins
+        sys.modules["__main__"] = module
+        sys.argv = [self.path] + self.argv
+        sys.path[0] = os.path.dirname(self.path)
+        try:
+            with open(self.path, "rb") as f:
+                source = f.read()
+            if os.environ.get("GINT_CONST_FOLD", "0") not in ("", "0"):
+                code, folded = _fold_consts(source, self.path)
+                if folded:
+                    print(f"gint: __main__: folded {', '.join(folded)}",
+                          file=sys.stderr)
+            else:
+                code = compile(source, self.path, "exec", dont_inherit=True)
+            exec(code, module.__dict__)
+            return 0
+        except _Reload:
+            return None
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else int(e.code is not None)
+        except Exception:
+            traceback.print_exc()
+            return 1
+        finally:
+            self.changed()  # Keep watching the modules it imported
+            # Imported again by the next run, from their new source
+            for name in set(sys.modules) - modules:
+                path = getattr(sys.modules[name], "__file__", None)
+                if path and _is_user_file(path):
+                    del sys.modules[name]
+
+    def wait(self) -> bool:
+        """Wait for a change; False if the window was closed meanwhile"""
+        name = os.path.basename(self.path)
+        print(f"gint: {name} ended, waiting for changes", file=sys.stderr)
+        if screen is not None:
+            pygame.display.set_caption(f"ClassPad - {name} ended")
+        while not self.changed():
+            if screen is not None and any(e.type == QUIT
+                                          for e in pygame.event.get()):
+                return False
+            time.sleep(0.1)
+        return True
+
+    def run(self) -> int:
+        while True:
+            status = self.run_program()
+            if screen is not None and not pygame.display.get_init():
+                return status or 0  # Window closed
+            if status is not None:
+                if not self.watch or not self.wait():
+                    return status
+            print(f"gint: files changed, restarting "
+                  f"{os.path.basename(self.path)}", file=sys.stderr)
+
+_launcher = None
+
+# Import time. "python gint.py bench-import" imports gint in fresh interpreters
+# with -X importtime and fails if the median time spent in gint itself (not in
+# pygame and NumPy) is over the budget, or if importing opened the display.
+_IMPORT_BUDGET_MS = float(os.environ.get("GINT_IMPORT_BUDGET_MS", "20"))
+
+def _bench_import(runs: int, budget_ms: float) -> int:
+    import subprocess
+    root = os.path.dirname(os.path.abspath(__file__))
+    env = dict(os.environ, GINT_HUD="0", PYTHONPATH=os.pathsep.join(
+        filter(None, [root, os.environ.get("PYTHONPATH")])))
+    script = "import gint, pygame; print(pygame.display.get_init())"
+    own, total = [], []
+    for run in range(runs + 1):
+        # The first run only makes sure that the bytecode is cached
+        if run == 0:
+            env.pop("PYTHONDONTWRITEBYTECODE", None)
+        elif run == 1:
+            env = dict(env, PYTHONDONTWRITEBYTECODE="1")
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", script],
+            env=env, capture_output=True, text=True)
+        if result.returncode:
+            print(result.stderr, file=sys.stderr)
+            return 1
+        if result.stdout.split()[-1] == "True":
+            print("gint: importing gint initialized the display",
+                  file=sys.stderr)
+            return 1
+        for line in result.stderr.splitlines():
+            fields = line.split("|")
+            if run and len(fields) == 3 and fields[2].strip() == "gint":
+                own.append(int(fields[0].split(":")[1]) / 1000)
+                total.append(int(fields[1]) / 1000)
+    own_ms, total_ms = float(_np.median(own)), float(_np.median(total))
+    print(f"gint: import {own_ms:.1f} ms in gint, {total_ms:.1f} ms with "
+          f"pygame and NumPy (median of {runs}), budget {budget_ms:g} ms")
+    if own_ms > budget_ms:
+        print("gint: import time over budget", file=sys.stderr)
+        return 1
+    return 0
+
+# Batch check. "python gint.py check-batch" draws random batches with
+# dpixels(), drects() and dlines(), with repeated pixels, C_INVERT and C_NONE
+# among the colors and random windows, and fails if any result differs from
+# the loop of single calls that gint_batch.py uses on the calculator.
+
+def _check_batches(runs: int, seed: int = 0) -> int:
+    rng = _random.Random(seed)
+    single = {dpixels: (2, dpixel), drects: (4, drect), dlines: (4, dline)}
+    colors = (C_BLACK, C_RED, C_BLUE, C_INVERT, C_NONE)
+    start = _np.empty_like(vram)
+    failures = 0
+    for run in range(runs):
+        batch = rng.choice(list(single))
+        group, func = single[batch]
+        count = rng.randrange(1, 16)
+        # Small range, so that pixels and shapes overlap
+        coords = [rng.randrange(-4, 24) for _ in range(group * count)]
+        if rng.random() < 0.5:
+            color = rng.choice(colors)
+            per_call = [color] * count
+        else:
+            color = per_call = [rng.choice(colors) for _ in range(count)]
+        x, y = rng.randrange(-4, 12), rng.randrange(-4, 12)
+        dwindow_set(x, y, x + rng.randrange(0, 20), y + rng.randrange(0, 20))
+        start[...] = _np.frombuffer(rng.randbytes(vram.nbytes),
+                                    dtype=_np.uint16).reshape(vram.shape)
+        vram[...] = start
+        batch(coords, color)
+        result = vram.copy()
+        vram[...] = start
+        for i in range(count):
+            func(*coords[group * i:group * (i + 1)], per_call[i])
+        if not _np.array_equal(result, vram):
+            failures += 1
+            if failures <= 5:
+                print(f"gint: {batch.__name__}({coords}, {color}) in window "
+                      f"{dwindow_get()} differs from {func.__name__}() calls",
+                      file=sys.stderr)
+    dwindow_set(0, 0, DWIDTH, DHEIGHT)
+    dclear(C_WHITE)
+    print(f"gint: {runs - failures} of {runs} batches match single calls")
+    return 1 if failures else 0
+
+def _main(argv: list) -> int:
+    """Command line of the simulator (python gint.py run program.py)"""
+    global _launcher
+    import argparse
+    parser = argparse.ArgumentParser(prog="gint.py")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser(
+        "run", help="run a program, and again whenever its files change")
+    run.add_argument("--once", action="store_true",
+                     help="exit when the program ends, do not watch files")
+    run.add_argument("program")
+    run.add_argument("args", nargs=argparse.REMAINDER)
+    bench = commands.add_parser(
+        "bench-import", help="check the time taken to import gint")
+    bench.add_argument("--runs", type=int, default=10)
+    bench.add_argument("--budget", type=float, default=_IMPORT_BUDGET_MS,
+                       help="maximum milliseconds spent in gint itself")
+    check = commands.add_parser(
+        "check-batch", help="check that batched drawing matches single calls")
+    check.add_argument("--runs", type=int, default=1000)
+    options = parser.parse_args(argv)
+    if options.command == "check-batch":
+        return _check_batches(options.runs)
+    if options.command == "bench-import":
+        return _bench_import(options.runs, options.budget)
+    _launcher = _Launcher(options.program, options.args, not options.once)
+    return _launcher.run()
+
 #  --- INIT STUFF
     
-vram.fill(C_WHITE)
-dupdate()
\ No newline at end of file
+dclear(C_WHITE)  # Shown by the first dupdate(), which opens the window
+_install_tools()
\ No newline at end of file
@@ -0,0 +1,84 @@
+import gint
+
+# =============================================================================
+# BATCHED DRAWING
+# =============================================================================
+#
+# dpixels(), drects() and dlines() take flat sequences of coordinates (list,
+# array, bytes...) and a single color or one color per element:
+#
+#   dpixels([x0, y0, x1, y1, ...], colors)
+#   drects([x1, y1, x2, y2, ...], colors)
+#   dlines([x1, y1, x2, y2, ...], colors)
+#
+# Sprite sheets cut an image into cells, either a grid or (x, y, w, h) rects,
+# and dsprites() draws many of them in order:
+#
+#   sheet = SpriteSheet(tiles, 16, 16)
+#   dsprites(sheet, [x0, y0, cell0, x1, y1, cell1, ...])
+#
+# The simulator draws them in a single pass. The calculator's gint does not
+# have them, so this module falls back to plain loops there. Copy it next to
+# your program and use:
+#
+#   from gint_batch import dpixels, drects, dlines, SpriteSheet, dsprites
+
+def _color(colors, i):
+    if isinstance(colors, int):
+        return colors
+    return colors[i]
+
+try:
+    dpixels = gint.dpixels
+except AttributeError:
+    def dpixels(points, colors):
+        dpixel = gint.dpixel
+        for i in range(len(points) // 2):
+            dpixel(points[2*i], points[2*i+1], _color(colors, i))
+
+try:
+    drects = gint.drects
+except AttributeError:
+    def drects(rects, colors):
+        drect = gint.drect
+        for i in range(len(rects) // 4):
+            j = 4 * i
+            drect(rects[j], rects[j+1], rects[j+2], rects[j+3], _color(colors, i))
+
+try:
+    dlines = gint.dlines
+except AttributeError:
+    def dlines(lines, colors):
+        dline = gint.dline
+        for i in range(len(lines) // 4):
+            j = 4 * i
+            dline(lines[j], lines[j+1], lines[j+2], lines[j+3], _color(colors, i))
+
+try:
+    SpriteSheet = gint.SpriteSheet
+    dsprites = gint.dsprites
+except AttributeError:
+    class SpriteSheet:
+        def __init__(self, img, cell_width=0, cell_height=0, rects=None):
+            self.image = img
+            if rects is None:
+                rects = []
+                for r in range(img.height // cell_height):
+                    for c in range(img.width // cell_width):
+                        rects.append((c * cell_width, r * cell_height,
+                                      cell_width, cell_height))
+            self.rects = rects
+
+        def __len__(self):
+            return len(self.rects)
+
+    def dsprites(sheet, sprites):
+        dsubimage = gint.dsubimage
+        img = sheet.image
+        rects = sheet.rects
+        if len(sprites) and not isinstance(sprites[0], int):
+            sprites = [v for sprite in sprites for v in sprite]
+        for i in range(len(sprites) // 3):
+            j = 3 * i
+            x, y, w, h = rects[sprites[j+2]]
+            dsubimage(sprites[j], sprites[j+1], img, x, y, w, h)